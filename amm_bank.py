@@ -0,0 +1,147 @@
+import numpy as np
+
+import instrumentation
+from concentrated_amm import ConcentratedLiquidityAMM
+
+
+class AMMBank:
+    # Reserves of many constant-product pools held as parallel arrays; pool i mirrors one UniswapV2AMM.
+    def __init__(self, money, power):
+        self.money = np.array(money, dtype=np.float64)
+        self.power = np.array(power, dtype=np.float64)
+        self.k = self.money * self.power
+
+    @classmethod
+    def from_amms(cls, amms):
+
+        # Accepts UniswapV2AMM (money/power) or AutomatedMarketMaker (reserve_y money, reserve_x power).
+        # A ConcentratedLiquidityAMM does not trade on money * power = k over its balances.
+        if any(isinstance(amm, ConcentratedLiquidityAMM) for amm in amms):
+            raise ValueError("AMMBank holds full-range pools only, not ConcentratedLiquidityAMM")
+        money = [amm.money if hasattr(amm, 'money') else amm.reserve_y for amm in amms]
+        power = [amm.power if hasattr(amm, 'power') else amm.reserve_x for amm in amms]
+        return cls(money, power)
+
+    def write_back(self, amms):
+
+        for amm, money, power in zip(amms, self.money.tolist(), self.power.tolist()):
+            if hasattr(amm, 'money'):
+                amm.money, amm.power, amm.k = money, power, money * power
+            else:
+                amm.reserve_y, amm.reserve_x = money, power
+
+    def __len__(self):
+        return len(self.money)
+
+    def _reserves(self, pools):
+
+        if pools is None:
+            return self.money, self.power, self.k
+        return self.money[pools], self.power[pools], self.k[pools]
+
+    def get_price_for_power(self, power_demand, pools=None):
+
+        money, power, k = self._reserves(pools)
+        power_demand = np.asarray(power_demand, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            money_required = k / (power - power_demand) - money
+        return np.where(power_demand >= power, np.inf, np.maximum(money_required, 1))
+
+    def get_power_for_money(self, money_received, pools=None):
+
+        money, power, k = self._reserves(pools)
+        money_received = np.asarray(money_received, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            power_provided = power - k / (money + money_received)
+        return np.where(money_received >= money, np.inf, np.maximum(power_provided, 0))
+
+    def get_price(self, delta_x, pools=None):
+
+        # AutomatedMarketMaker.get_price: money released for delta_x power added to the pool.
+        money, power, k = self._reserves(pools)
+        delta_x = np.asarray(delta_x, dtype=np.float64)
+        return money - k / (power + delta_x)
+
+    def _curve(self, values, pools):
+
+        # Reserves shaped (pools, 1, ...) against `values`, so results are (pools,) + values.shape.
+        money, power, k = (np.atleast_1d(reserve) for reserve in self._reserves(pools))
+        values = np.asarray(values, dtype=np.float64)
+        shape = money.shape + (1,) * values.ndim
+        return money.reshape(shape), power.reshape(shape), k.reshape(shape), values
+
+    def depth(self, sizes, is_buying=True, pools=None):
+
+        # Depth curve of every pool over an array of trade sizes (power). Buying mirrors
+        # get_price_for_power, including its 1-money minimum; selling mirrors get_price. Both use
+        # the cancellation-free forms money * q / (power -+ q) of k / (power -+ q) - money.
+        # Slippage is the relative shortfall of the average price against the spot price.
+        money, power, k, sizes = self._curve(sizes, pools)
+        spot = money / power
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if is_buying:
+                amount = np.where(sizes >= power, np.inf, np.maximum(money * sizes / (power - sizes), 1))
+                price = amount / sizes
+                slippage = price / spot - 1
+            else:
+                amount = money * sizes / (power + sizes)
+                price = amount / sizes
+                slippage = 1 - price / spot
+        return {'money': amount, 'price': price, 'slippage': slippage, 'spot': spot.reshape(money.shape[:1])}
+
+    def size_for_budget(self, budget, pools=None):
+
+        # Most power each pool sells for at most `budget` money: inverts k / (power - q) - money,
+        # and is 0 below the 1-money minimum charge.
+        money, power, k, budget = self._curve(budget, pools)
+        return np.where(budget >= 1, power * budget / (money + budget), 0.0)
+
+    def size_for_price(self, limit_price, is_buying=True, marginal=False, pools=None):
+
+        # Largest trade whose average price (or marginal price, with marginal=True) stays at or
+        # better than limit_price: at most limit_price per unit when buying, at least when selling.
+        money, power, k, limit_price = self._curve(limit_price, pools)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if is_buying:
+                size = power - (np.sqrt(k / limit_price) if marginal else money / limit_price)
+                if not marginal:
+                    # Below 1 / limit_price the 1-money minimum charge alone exceeds the limit.
+                    size = np.where(size * limit_price >= 1, size, 0.0)
+            else:
+                size = (np.sqrt(k / limit_price) if marginal else money / limit_price) - power
+        return np.maximum(size, 0.0)
+
+    def update_pool_buy(self, pools, power_demand, money_paid):
+
+        pools = np.asarray(pools)
+        np.subtract.at(self.power, pools, power_demand)
+        np.add.at(self.money, pools, money_paid)
+        self.k[pools] = self.money[pools] * self.power[pools]
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates", pools.size)
+
+    def update_pool_sell(self, pools, power_provided, money_received):
+
+        pools = np.asarray(pools)
+        np.add.at(self.power, pools, power_provided)
+        np.subtract.at(self.money, pools, money_received)
+        self.k[pools] = self.money[pools] * self.power[pools]
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates", pools.size)
+
+    def trade(self, pools, delta_x):
+
+        # AutomatedMarketMaker.trade for a batch; trades on the same pool are applied in order.
+        pools = np.asarray(pools)
+        delta_x = np.broadcast_to(np.asarray(delta_x, dtype=np.float64), pools.shape)
+        unique_pools = np.unique(pools)
+        if len(unique_pools) == len(pools):
+            delta_y = self.get_price(delta_x, pools)
+            self.update_pool_sell(pools, delta_x, delta_y)
+            return delta_y
+
+        delta_y = np.empty(len(pools))
+        for i, (pool, dx) in enumerate(zip(pools.tolist(), delta_x.tolist())):
+            delta_y[i] = self.get_price(dx, pool)
+            self.update_pool_sell([pool], dx, delta_y[i])
+        return delta_y
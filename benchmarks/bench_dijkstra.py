@@ -0,0 +1,88 @@
+# Scaling benchmark for routing.dijkstra on synthetic grids.
+# Run from the repository root: python -m benchmarks.bench_dijkstra [--legacy]
+import heapq
+import random
+import sys
+import time
+import tracemalloc
+
+from routing import dijkstra
+
+
+def legacy_dijkstra(paths_graph, start, end):
+
+    # The path-copying implementation previously shipped in Dijkstra.py / main method.py.
+    queue = [(0, start, [])]
+    visited = set()
+
+    while queue:
+        total_loss, node, path = heapq.heappop(queue)
+
+        if node in visited:
+            continue
+        visited.add(node)
+
+        path = path + [node]
+
+        if node == end:
+            return total_loss, path
+
+        for neighbor, loss in paths_graph.get(node, []):
+            if neighbor not in visited:
+                heapq.heappush(queue, (total_loss + loss, neighbor, path))
+
+    return float('inf'), []
+
+
+def grid_graph(rows, cols, seed=0):
+
+    rng = random.Random(seed)
+    paths_graph = {}
+    for r in range(rows):
+        for c in range(cols):
+            node = f"n{r}_{c}"
+            edges = paths_graph.setdefault(node, [])
+            if r + 1 < rows:
+                edges.append((f"n{r + 1}_{c}", rng.uniform(0.001, 0.01)))
+            if c + 1 < cols:
+                edges.append((f"n{r}_{c + 1}", rng.uniform(0.001, 0.01)))
+            if r > 0:
+                edges.append((f"n{r - 1}_{c}", rng.uniform(0.001, 0.01)))
+            if c > 0:
+                edges.append((f"n{r}_{c - 1}", rng.uniform(0.001, 0.01)))
+    return paths_graph
+
+
+def timed(func, *args):
+
+    begin = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - begin, result
+
+
+def peak_memory(func, *args):
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+if __name__ == "__main__":
+    include_legacy = "--legacy" in sys.argv
+
+    print(f"{'nodes':>8} {'dijkstra (s)':>14} {'peak (MiB)':>12} {'legacy (s)':>12} {'peak (MiB)':>12}")
+    for side in (32, 100, 317):
+        paths_graph = grid_graph(side, side)
+        start, end = "n0_0", f"n{side - 1}_{side - 1}"
+
+        elapsed, (total_loss, path) = timed(dijkstra, paths_graph, start, end)
+        peak = peak_memory(dijkstra, paths_graph, start, end)
+        legacy, legacy_peak = "-", "-"
+        if include_legacy or side < 317:
+            legacy_elapsed, (legacy_loss, _) = timed(legacy_dijkstra, paths_graph, start, end)
+            assert abs(legacy_loss - total_loss) < 1e-9
+            legacy = f"{legacy_elapsed:.3f}"
+            legacy_peak = f"{peak_memory(legacy_dijkstra, paths_graph, start, end):.1f}"
+        print(f"{side * side:>8} {elapsed:>14.3f} {peak:>12.1f} {legacy:>12} {legacy_peak:>12}")
@@ -0,0 +1,62 @@
+# Resident memory per order for a book of non-crossing limit orders, comparing the pre-__slots__
+# Order class, the slotted Order and the array-backed OrderStore.
+# Run from the repository root: python -m benchmarks.bench_memory [max_orders]
+import random
+import sys
+import tracemalloc
+
+from script_loader import load_script
+
+order_book = load_script("order book.py")
+
+
+class LegacyOrder:
+    # The Order class as it was before __slots__, with a per-instance __dict__.
+    def __init__(self, user, quantity, price, order_type, is_buy, order_id=None):
+
+        self.user = user
+        self.quantity = quantity
+        self.price = price
+        self.order_type = order_type
+        self.is_buy = is_buy
+        self.order_id = order_id
+
+
+def resting_orders(count, seed=0, users=1000, mid_price=100.0, spread=10.0):
+
+    # Bids strictly below asks, so nothing matches and every order rests.
+    rng = random.Random(seed)
+    user_ids = [f"U{i}" for i in range(users)]
+    orders = []
+    for _ in range(count):
+        is_buy = rng.random() < 0.5
+        offset = round(rng.uniform(0.01, spread), 2)
+        orders.append((rng.choice(user_ids), rng.uniform(1, 50), mid_price - offset if is_buy else mid_price + offset,
+                       is_buy))
+    return orders
+
+
+def book_memory(orders, order_cls, store_cls=None):
+
+    tracemalloc.start()
+    book = order_book.OrderBook(store=store_cls() if store_cls else None)
+    for user, quantity, price, is_buy in orders:
+        book.add_order(order_cls(user, quantity, price, "limit", is_buy))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(book.orders) == len(orders)
+    return current / len(orders)
+
+
+if __name__ == "__main__":
+    max_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+
+    print(f"{'orders':>8} {'legacy (B/order)':>17} {'slots (B/order)':>16} {'store (B/order)':>16}")
+    count = 10 ** 4
+    while count <= max_orders:
+        orders = resting_orders(count)
+        legacy = book_memory(orders, LegacyOrder)
+        slotted = book_memory(orders, order_book.Order)
+        stored = book_memory(orders, order_book.Order, order_book.OrderStore)
+        print(f"{count:>8} {legacy:>17.1f} {slotted:>16.1f} {stored:>16.1f}")
+        count *= 10
@@ -0,0 +1,68 @@
+import math
+import random
+
+
+def grid_topology(size, seed=0, chord_fraction=0.1, loss_low=0.001, loss_high=0.01):
+
+    # Meshed grid: a square lattice of about `size` nodes with bidirectional lines plus random chords.
+    rng = random.Random(seed)
+    side = max(2, math.isqrt(size - 1) + 1)
+    nodes = [f"n{i}" for i in range(side * side)]
+    edges = []
+
+    def connect(a, b):
+        loss = rng.uniform(loss_low, loss_high)
+        edges.append((nodes[a], nodes[b], loss))
+        edges.append((nodes[b], nodes[a], loss))
+
+    for r in range(side):
+        for c in range(side):
+            i = r * side + c
+            if c + 1 < side:
+                connect(i, i + 1)
+            if r + 1 < side:
+                connect(i, i + side)
+    for _ in range(int(len(nodes) * chord_fraction)):
+        a, b = rng.sample(range(len(nodes)), 2)
+        connect(a, b)
+    return nodes, edges
+
+
+def as_paths_graph(edges):
+
+    paths_graph = {}
+    for src, dst, loss in edges:
+        paths_graph.setdefault(src, []).append((dst, loss))
+    return paths_graph
+
+
+def user_population(nodes, seed=0, seller_fraction=0.5, energy_high=50.0, price_low=1.0, price_high=10.0):
+
+    # (user_id, role, energy, price) tuples in the shape of p2p.User; buyers carry negative energy.
+    rng = random.Random(seed)
+    population = []
+    for node in nodes:
+        if rng.random() < seller_fraction:
+            population.append((node, 'seller', rng.uniform(1, energy_high), rng.uniform(price_low, price_high)))
+        else:
+            population.append((node, 'buyer', -rng.uniform(1, energy_high), rng.uniform(price_low, price_high)))
+    return population
+
+
+def order_stream(count, users, seed=0, mid_price=100, spread=10, max_quantity=50):
+
+    # (user, quantity, price, is_buy) tuples for OrderBook, with prices on integer ticks around mid_price.
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(count):
+        is_buy = rng.random() < 0.5
+        offset = rng.randint(0, spread)
+        price = mid_price - offset + spread // 2 if is_buy else mid_price + offset - spread // 2
+        stream.append((rng.choice(users), rng.randint(1, max_quantity), price, is_buy))
+    return stream
+
+
+def amm_pools(count, seed=0, reserve_low=1000.0, reserve_high=100000.0):
+
+    rng = random.Random(seed)
+    return [(rng.uniform(reserve_low, reserve_high), rng.uniform(reserve_low, reserve_high)) for _ in range(count)]
@@ -0,0 +1,301 @@
+# Benchmark suite: times the routing, matching and AMM hot paths on seeded synthetic inputs.
+# Run from the repository root: python -m benchmarks.run [--max-size N] [--seed S] [--output results.json]
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from amm_bank import AMMBank
+from benchmarks.generators import amm_pools, as_paths_graph, grid_topology, order_stream, user_population
+from concentrated_amm import ConcentratedLiquidityAMM
+from Dijkstra import UniswapV2AMM
+from p2p import EnergyMarket, User
+from routing import Landmarks, RouteCache, alt_dijkstra, dijkstra
+from script_loader import load_script
+from topology import load_topology, save_topology
+from zones import ZonedMarket
+
+SIZES = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+CASES = []
+
+
+def case(name, max_size=SIZES[-1]):
+
+    def register(func):
+        CASES.append((name, max_size, func))
+        return func
+    return register
+
+
+def timed_calls(calls):
+
+    latencies = []
+    for func, args in calls:
+        begin = time.perf_counter_ns()
+        func(*args)
+        latencies.append(time.perf_counter_ns() - begin)
+    return latencies
+
+
+def point_queries(nodes, seed, count):
+
+    rng = random.Random(seed)
+    return [tuple(rng.sample(nodes, 2)) for _ in range(count)]
+
+
+@case("routing.dijkstra")
+def bench_routing_dijkstra(size, seed):
+
+    nodes, edges = grid_topology(size, seed)
+    paths_graph = as_paths_graph(edges)
+    queries = point_queries(nodes, seed, 20)
+    return timed_calls([(dijkstra, (paths_graph, start, end)) for start, end in queries]), len(queries)
+
+
+@case("routing.alt_dijkstra", max_size=10 ** 5)
+def bench_routing_alt(size, seed):
+
+    # Landmark preprocessing is per topology and stays out of the timed calls.
+    nodes, edges = grid_topology(size, seed)
+    paths_graph = as_paths_graph(edges)
+    landmarks = Landmarks(paths_graph, seed=seed)
+    queries = point_queries(nodes, seed, 20)
+    return timed_calls([(alt_dijkstra, (paths_graph, start, end, landmarks)) for start, end in queries]), len(queries)
+
+
+@case("RouteCache.update_edge_loss")
+def bench_route_cache_update(size, seed):
+
+    # Loss drifts on random lines, each repairing one cached full tree; compare routing.dijkstra.
+    nodes, edges = grid_topology(size, seed)
+    route_cache = RouteCache(as_paths_graph(edges))
+    route_cache.tree(nodes[0])
+    rng = random.Random(seed)
+    updates = [(src, dst, loss * rng.uniform(0.5, 2.0)) for src, dst, loss in rng.choices(edges, k=200)]
+    return timed_calls([(route_cache.update_edge_loss, update) for update in updates]), len(updates)
+
+
+def build_graph(size, seed):
+
+    graph = load_script("one DEX.py").Graph()
+    nodes, edges = grid_topology(size, seed)
+    for src, dst, loss in edges:
+        graph.add_edge(src, dst, loss)
+    return graph, nodes
+
+
+@case("topology.load_topology")
+def bench_load_topology(size, seed):
+
+    # Memory-mapped load of a saved grid into a Graph; items are edges.
+    _, edges = grid_topology(size, seed)
+    handle, filename = tempfile.mkstemp(suffix=".topo")
+    os.close(handle)
+    try:
+        save_topology(filename, edges)
+        return timed_calls([(lambda: load_topology(filename).to_graph(), ())]), len(edges)
+    finally:
+        os.remove(filename)
+
+
+@case("Graph.dijkstra")
+def bench_graph_dijkstra(size, seed):
+
+    graph, nodes = build_graph(size, seed)
+    graph.dijkstra(nodes[0])
+    starts = [start for start, _ in point_queries(nodes, seed, 5)]
+    return timed_calls([(graph.dijkstra, (start,)) for start in starts]), len(starts)
+
+
+@case("Graph.shortest_path[ALT]", max_size=10 ** 5)
+def bench_graph_alt(size, seed):
+
+    graph, nodes = build_graph(size, seed)
+    graph.build_landmarks(seed=seed)
+    queries = point_queries(nodes, seed, 20)
+    return timed_calls([(graph.shortest_path, query) for query in queries]), len(queries)
+
+
+def build_market(size, seed, **kwargs):
+
+    market = EnergyMarket(**kwargs)
+    nodes, edges = grid_topology(size, seed)
+    for user_id, role, energy, price in user_population(nodes, seed):
+        market.add_user(User(user_id, role, energy, price))
+    for src, dst, loss in edges:
+        market.add_path(src, dst, loss)
+    return market, nodes
+
+
+@case("EnergyMarket.find_paths", max_size=16)
+def bench_find_paths(size, seed):
+
+    market, nodes = build_market(size, seed)
+    queries = point_queries(nodes, seed, 20)
+    return timed_calls([(market.find_paths, (start, end)) for start, end in queries]), len(queries)
+
+
+@case("EnergyMarket.calculate_trade", max_size=10 ** 3)
+def bench_calculate_trade(size, seed):
+
+    market, _ = build_market(size, seed)
+    return timed_calls([(market.calculate_trade, ())]), len(market.users)
+
+
+@case("EnergyMarket.calculate_trade[min_cost_flow]", max_size=10 ** 3)
+def bench_calculate_trade_min_cost_flow(size, seed):
+
+    market, _ = build_market(size, seed)
+    return timed_calls([(market.calculate_trade, ('min_cost_flow',))]), len(market.users)
+
+
+def match_orders_calls(size, seed, compact):
+
+    order_book = load_script("order book.py")
+    book = order_book.OrderBook(store=order_book.OrderStore() if compact else None)
+    users = [f"U{i}" for i in range(100)]
+    for buyer in users:
+        for seller in users:
+            book.add_path(order_book.Path(buyer, seller, 0.0))
+    stream = order_stream(size, users, seed)
+
+    def submit(user, quantity, price, is_buy):
+        book.add_order(order_book.Order(user, quantity, price, "limit", is_buy))
+        book.match_orders()
+
+    return timed_calls([(submit, event) for event in stream]), len(stream)
+
+
+@case("OrderBook.match_orders")
+def bench_match_orders(size, seed):
+
+    return match_orders_calls(size, seed, compact=False)
+
+
+@case("OrderBook.match_orders[OrderStore]")
+def bench_match_orders_store(size, seed):
+
+    return match_orders_calls(size, seed, compact=True)
+
+
+@case("OrderBook.clear_batch[OrderStore]")
+def bench_clear_batch(size, seed):
+
+    # The whole stream rests unmatched, then clears in one call auction.
+    order_book = load_script("order book.py")
+    book = order_book.OrderBook(store=order_book.OrderStore())
+    users = [f"U{i}" for i in range(100)]
+    for buyer in users:
+        for seller in users:
+            book.add_path(order_book.Path(buyer, seller, 0.0))
+    stream = order_stream(size, users, seed)
+    for user, quantity, price, is_buy in stream:
+        book.add_order(order_book.Order(user, quantity, price, "limit", is_buy))
+    return timed_calls([(book.clear_batch, ())]), len(stream)
+
+
+@case("ZonedMarket.match", max_size=10 ** 5)
+def bench_zoned_match(size, seed):
+
+    # 100 users in 10 zones, fully meshed inside a zone plus a sparse set of inter-zone paths;
+    # one match() over the whole stream on a pool of os.cpu_count() workers.
+    order_book = load_script("order book.py")
+    users = [f"U{i}" for i in range(100)]
+    zone_of = {user: i % 10 for i, user in enumerate(users)}
+    rng = random.Random(seed)
+    with ZonedMarket(zone_of) as market:
+        for buyer in users:
+            for seller in users:
+                if zone_of[buyer] == zone_of[seller]:
+                    market.add_path(order_book.Path(buyer, seller, 0.01))
+                elif rng.random() < 0.05:
+                    market.add_path(order_book.Path(buyer, seller, rng.uniform(0.03, 0.08)))
+        stream = order_stream(size, users, seed)
+        for user, quantity, price, is_buy in stream:
+            market.add_order(order_book.Order(user, quantity, price, "limit", is_buy))
+        return timed_calls([(market.match, ())]), len(stream)
+
+
+@case("UniswapV2AMM.get_price_for_power")
+def bench_amm_quote(size, seed):
+
+    amms = [UniswapV2AMM(money, power) for money, power in amm_pools(size, seed)]
+    return timed_calls([(amm.get_price_for_power, (10.0,)) for amm in amms]), len(amms)
+
+
+@case("ConcentratedLiquidityAMM.get_price_for_power", max_size=10 ** 5)
+def bench_concentrated_quote(size, seed):
+
+    # `size` random positions around price 1; each quote takes out a random share of the power up
+    # to a third of the pool's, crossing up to every initialized tick above the price.
+    rng = random.Random(seed)
+    pool = ConcentratedLiquidityAMM(1.0, tick_spacing=10)
+    for _ in range(size):
+        lower = rng.randrange(-5000, 5000) // 10 * 10
+        pool.add_liquidity(lower, lower + 10 * rng.randint(1, 20), rng.uniform(1e4, 1e5))
+    demands = [pool.power * rng.uniform(0, 1 / 3) for _ in range(100)]
+    return timed_calls([(pool.get_price_for_power, (demand,)) for demand in demands]), len(demands)
+
+
+@case("AMMBank.get_price_for_power")
+def bench_amm_bank_quote(size, seed):
+
+    bank = AMMBank(*zip(*amm_pools(size, seed)))
+    return timed_calls([(bank.get_price_for_power, (10.0,)) for _ in range(20)]), 20 * size
+
+
+@case("AMMBank.depth", max_size=10 ** 4)
+def bench_amm_bank_depth(size, seed):
+
+    # One 1000-point depth curve per pool per call; items are curve points.
+    bank = AMMBank(*zip(*amm_pools(size, seed)))
+    sizes = np.linspace(1.0, 500.0, 1000)
+    return timed_calls([(bank.depth, (sizes,)) for _ in range(5)]), 5 * size * len(sizes)
+
+
+def summarize(name, size, latencies, items):
+
+    latencies = np.array(latencies, dtype=np.float64)
+    total = latencies.sum() / 1e9
+    return {
+        'case': name,
+        'size': size,
+        'calls': len(latencies),
+        'items': items,
+        'total_s': total,
+        'throughput_per_s': items / total if total else float('inf'),
+        'p50_us': float(np.percentile(latencies, 50)) / 1e3,
+        'p99_us': float(np.percentile(latencies, 99)) / 1e3,
+    }
+
+
+def run(max_size, seed, names=None):
+
+    results = []
+    for name, case_max_size, func in CASES:
+        if names and name not in names:
+            continue
+        for size in sorted({min(size, case_max_size) for size in SIZES if size <= max_size}):
+            latencies, items = func(size, seed)
+            results.append(summarize(name, size, latencies, items))
+            print(f"{name:<44} {size:>8} {results[-1]['throughput_per_s']:>14.1f}/s "
+                  f"p50 {results[-1]['p50_us']:>10.1f}us p99 {results[-1]['p99_us']:>10.1f}us")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-size", type=int, default=10 ** 4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--case", action="append", dest="cases")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = run(args.max_size, args.seed, args.cases)
+    with open(args.output, "w") as output:
+        json.dump({'python': platform.python_version(), 'seed': args.seed, 'results': results}, output, indent=2)
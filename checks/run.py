@@ -0,0 +1,291 @@
+# Seeded regression checks: each one runs a scenario or cross-checks an algorithm against a plain
+# reference implementation and raises AssertionError on a mismatch.
+# Run from the repository root: python -m checks.run [--seed S] [--check NAME]
+import argparse
+import asyncio
+import math
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from concentrated_amm import ConcentratedLiquidityAMM, sqrt_price_at
+from flow import EPSILON, transportation
+from order_gateway import _STOP, OrderGateway, order_book
+from routing import Landmarks, RouteCache, alt_dijkstra, dijkstra, path_loss, shortest_path_tree
+from snapshot import load_snapshot, save_snapshot
+
+CHECKS = []
+
+
+def check(name):
+
+    def register(func):
+        CHECKS.append((name, func))
+        return func
+    return register
+
+
+@check("OrderGateway.cancelled_submit")
+def check_gateway_cancelled_submit(seed):
+
+    # A rejected order whose submitter already gave up must not take the match loop down, and
+    # orders queued behind stop() are failed rather than left waiting.
+    async def scenario():
+        gateway = OrderGateway()
+        await gateway.start()
+        # One step queues the order; cancelling then resolves its future before the loop sees it.
+        cancelled = asyncio.create_task(gateway.submit(order_book.Order("A", 1, "50", "limit", True)))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        fills = await asyncio.wait_for(gateway.submit(order_book.Order("A", 1, 50, "limit", True)), 5)
+        assert fills == [] and not gateway._task.done()
+
+        # What stop() does, with an order slipping into the queue right behind the stop marker.
+        behind = asyncio.get_running_loop().create_future()
+        gateway._stopping = True
+        await gateway.queue.put((_STOP, None, None))
+        await gateway.queue.put((order_book.Order("A", 1, 50, "limit", True), 0.0, behind))
+        await gateway._task
+        assert isinstance(behind.exception(), RuntimeError)
+        try:
+            await gateway.submit(order_book.Order("A", 1, 50, "limit", True))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("submit() accepted an order after stop()")
+
+    asyncio.run(scenario())
+
+
+@check("OrderBook.rejected_store_order")
+def check_rejected_store_order(seed):
+
+    # An order the OrderStore refuses must not leave an empty price level behind.
+    book = order_book.OrderBook(store=order_book.OrderStore())
+    book.add_path(order_book.Path("A", "B", 0.0))
+    try:
+        book.add_order(order_book.Order("A", 1, 70, "limit", True, "not-an-int"))
+    except ValueError:
+        pass
+    assert book.best_bid() is None and not book.bid_levels
+    book.add_order(order_book.Order("A", 1, 50, "limit", True))
+    book.add_order(order_book.Order("B", 1, 45, "limit", False))
+    assert len(book.match_orders()) == 1
+
+
+@check("snapshot.key_round_trip")
+def check_snapshot_keys(seed):
+
+    # Tuple, int and nested ids come back with their types, so restored paths stay hashable.
+    book = order_book.OrderBook()
+    feeder, storage = ('feeder', 1), ('storage', (2, None))
+    book.add_path(order_book.Path(feeder, storage, 0.1, route=[feeder, 'bus', storage]))
+    book.add_order(order_book.Order(feeder, 5, 50, "limit", True))
+    book.add_order(order_book.Order(7, 5, 60, "limit", False))
+    handle, filename = tempfile.mkstemp(suffix=".snap")
+    os.close(handle)
+    try:
+        save_snapshot(filename, book=book)
+        restored = load_snapshot(filename).restore_order_book()
+    finally:
+        os.remove(filename)
+    path = restored.get_best_path(feeder, storage)
+    assert path is not None and path.route == [feeder, 'bus', storage]
+    assert [order.user for order in restored.resting_orders()] == [feeder, 7]
+
+
+def random_graph(rng, nodes, degree):
+
+    # Dict-of-list graph with random directed lines; some nodes end up unreachable.
+    graph = {node: [] for node in range(nodes)}
+    for node in range(nodes):
+        for neighbor in rng.sample(range(nodes), min(degree, nodes)):
+            if neighbor != node:
+                graph[node].append((neighbor, rng.uniform(0.01, 1.0)))
+    return graph
+
+
+def assert_close(got, want, what):
+
+    assert got == want or abs(got - want) <= 1e-9 * max(1.0, abs(want)), (what, got, want)
+
+
+@check("RouteCache.update_edge_loss")
+def check_route_cache_repair(seed):
+
+    # Trees repaired in place after each loss change match trees built from scratch.
+    rng = random.Random(seed)
+    for _ in range(20):
+        graph = random_graph(rng, rng.randint(2, 40), rng.randint(1, 4))
+        route_cache = RouteCache(graph)
+        starts = rng.sample(range(len(graph)), min(3, len(graph)))
+        for start in starts:
+            route_cache.tree(start)
+        for _ in range(30):
+            u = rng.randrange(len(graph))
+            if graph[u] and rng.random() < 0.8:
+                v = rng.choice(graph[u])[0]
+            else:
+                v = rng.randrange(len(graph))
+            route_cache.update_edge_loss(u, v, rng.choice([0.0, rng.uniform(0.01, 2.0), 5.0]))
+            for start in starts:
+                tree = route_cache.tree(start)
+                dist, _ = shortest_path_tree(graph, start)
+                assert tree.dist.keys() == dist.keys(), (start, tree.dist.keys() ^ dist.keys())
+                for node, loss in dist.items():
+                    assert_close(tree.dist[node], loss, node)
+                    assert_close(path_loss(graph, tree.path_to(node)[1]), loss, node)
+
+
+@check("routing.alt_dijkstra")
+def check_alt_dijkstra(seed):
+
+    # Same loss as plain Dijkstra on every pair, along a path that really has that loss.
+    rng = random.Random(seed)
+    for _ in range(20):
+        graph = random_graph(rng, rng.randint(1, 60), rng.randint(1, 3))
+        landmarks = Landmarks(graph, count=rng.randint(1, 8), seed=rng.randrange(1000))
+        for _ in range(50):
+            start, end = rng.randrange(len(graph)), rng.randrange(len(graph))
+            loss, path = alt_dijkstra(graph, start, end, landmarks)
+            want, _ = dijkstra(graph, start, end)
+            assert_close(loss, want, (start, end))
+            if path:
+                assert path[0] == start and path[-1] == end
+                assert_close(path_loss(graph, path), loss, (start, end))
+
+
+def reference_transportation(supply, demand, cost):
+
+    # Successive shortest paths with Bellman-Ford on an explicit residual graph; returns the
+    # (flow, cost) totals. Node 0 is the source, then supplies, demands and the sink.
+    S, B = len(supply), len(demand)
+    sink = S + B + 1
+    arcs = []
+    adjacent = [[] for _ in range(sink + 1)]
+
+    def add_arc(u, v, capacity, unit_cost):
+        adjacent[u].append(len(arcs))
+        arcs.append([v, capacity, unit_cost])
+        adjacent[v].append(len(arcs))
+        arcs.append([u, 0.0, -unit_cost])
+
+    for s in range(S):
+        add_arc(0, 1 + s, supply[s], 0.0)
+    for b in range(B):
+        add_arc(1 + S + b, sink, demand[b], 0.0)
+    for s in range(S):
+        for b in range(B):
+            if math.isfinite(cost[s][b]):
+                add_arc(1 + s, 1 + S + b, float('inf'), cost[s][b])
+
+    total_flow = total_cost = 0.0
+    while True:
+        dist = [float('inf')] * (sink + 1)
+        via = [None] * (sink + 1)
+        dist[0] = 0.0
+        for _ in range(sink):
+            for u in range(sink + 1):
+                for arc in adjacent[u]:
+                    v, capacity, unit_cost = arcs[arc]
+                    if capacity > EPSILON and dist[u] + unit_cost < dist[v] - 1e-12:
+                        dist[v], via[v] = dist[u] + unit_cost, arc
+        if via[sink] is None:
+            return total_flow, total_cost
+        path, node = [], sink
+        while node:
+            path.append(via[node])
+            node = arcs[via[node] ^ 1][0]
+        amount = min(arcs[arc][1] for arc in path)
+        for arc in path:
+            arcs[arc][1] -= amount
+            arcs[arc ^ 1][1] += amount
+        total_flow += amount
+        total_cost += amount * dist[sink]
+
+
+@check("flow.transportation")
+def check_transportation(seed):
+
+    # Feasible, and moves as much energy as cheaply as the plain min-cost-flow reference.
+    rng = np.random.default_rng(seed)
+    for _ in range(100):
+        S, B = rng.integers(1, 7, size=2)
+        supply = rng.integers(0, 20, size=S).astype(float)
+        demand = rng.integers(0, 20, size=B).astype(float)
+        cost = rng.uniform(1.0, 10.0, size=(S, B)).round(2)
+        cost[rng.random((S, B)) < 0.3] = np.inf
+        flow = transportation(supply, demand, cost)
+        assert (flow >= -EPSILON).all() and (flow[~np.isfinite(cost)] <= EPSILON).all()
+        assert (flow.sum(axis=1) <= supply + 1e-6).all() and (flow.sum(axis=0) <= demand + 1e-6).all()
+        want_flow, want_cost = reference_transportation(supply.tolist(), demand.tolist(), cost.tolist())
+        used = flow > EPSILON
+        assert abs(flow.sum() - want_flow) <= 1e-6, (flow.sum(), want_flow)
+        assert abs((flow[used] * cost[used]).sum() - want_cost) <= 1e-6 * max(1.0, want_cost)
+
+
+def reference_swap(pool, amount, up):
+
+    # Money paid in (up) or out for `amount` of power, walking every initialized tick in order
+    # from a sorted list instead of the bitmap; inf if liquidity runs out first.
+    s, liquidity, remaining, money = pool.sqrt_price, pool.liquidity, amount, 0.0
+    ticks = sorted(pool.liquidity_net, reverse=not up)
+    for tick in [tick for tick in ticks if (sqrt_price_at(tick) > s if up else sqrt_price_at(tick) <= s)]:
+        s_next = sqrt_price_at(tick)
+        reach = liquidity * abs(1 / s - 1 / s_next)
+        if reach > remaining:
+            s_new = 1 / (1 / s - remaining / liquidity) if up else 1 / (1 / s + remaining / liquidity)
+            return money + liquidity * abs(s_new - s)
+        money += liquidity * abs(s_next - s)
+        remaining -= reach
+        s = s_next
+        liquidity += pool.liquidity_net[tick] if up else -pool.liquidity_net[tick]
+    return float('inf')
+
+
+@check("ConcentratedLiquidityAMM._swap")
+def check_concentrated_swap(seed):
+
+    # Bitmap tick walk quotes match the sorted-tick walk, including after committed swaps move
+    # the price across ranges; active liquidity always equals the positions straddling the tick.
+    rng = random.Random(seed)
+    for _ in range(30):
+        pool = ConcentratedLiquidityAMM(rng.uniform(0.5, 2.0), tick_spacing=rng.choice([1, 10, 60]))
+        spacing = pool.tick_spacing
+        for _ in range(rng.randint(1, 300)):
+            lower = rng.randrange(-20000, 20000) // spacing * spacing
+            pool.add_liquidity(lower, lower + spacing * rng.randint(1, 400), rng.uniform(1.0, 1000.0))
+        for _ in range(40):
+            demand = rng.uniform(0, 1) * max(pool.power, 1.0) * rng.choice([0.01, 0.3, 1.2])
+            up = rng.random() < 0.5
+            got = pool.get_price_for_power(demand) if up else pool.get_money_for_power(demand)
+            want = reference_swap(pool, demand, up)
+            assert got == want or abs(got - want) <= 1e-7 * max(1.0, want), (up, demand, got, want)
+            if math.isfinite(got) and rng.random() < 0.5:
+                if up:
+                    pool.update_pool_buy(demand, got)
+                else:
+                    pool.update_pool_sell(demand, got)
+                active = sum(liquidity for (lower, upper), liquidity in pool.positions.items()
+                             if lower <= pool.tick < upper)
+                assert abs(active - pool.liquidity) <= 1e-6 * max(1.0, active), (active, pool.liquidity)
+
+
+def run(seed, names=None):
+
+    for name, func in CHECKS:
+        if names and name not in names:
+            continue
+        func(seed)
+        print(f"{name:<44} ok")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="append", dest="checks")
+    args = parser.parse_args()
+
+    run(args.seed, args.checks)
@@ -0,0 +1,288 @@
+# Concentrated-liquidity (Uniswap V3 style) pool for power priced in money. Liquidity is placed on
+# [lower, upper) tick ranges, tick i being the price 1.0001 ** i money per power, and within one
+# range the pool trades like x*y=k on virtual reserves. Initialized ticks are kept in a bitmap of
+# 256-bit words, so a swap reaches the next initialized tick with one mask and bit scan per word
+# instead of walking ticks one by one.
+#
+# Quotes and updates follow UniswapV2AMM, so find_best_amm_and_path / execute_trade in Dijkstra.py
+# can route to these pools alongside full-range ones. Prices are floats, not Q64.96 fixed point.
+# AMMBank and snapshot.save_snapshot only model full-range reserves and reject these pools.
+# Run from the repository root for a demo: python concentrated_amm.py
+import math
+import time
+
+import instrumentation
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+WORD_BITS = 256
+# Liquidity and amounts below this are treated as zero.
+DUST = 1e-12
+_LOG_BASE = math.log(1.0001)
+
+
+def sqrt_price_at(tick):
+
+    return math.exp(tick * _LOG_BASE / 2)
+
+
+def tick_at(sqrt_price):
+
+    # Greatest tick whose sqrt price is <= sqrt_price.
+    return math.floor(2 * math.log(sqrt_price) / _LOG_BASE)
+
+
+class TickBitmap:
+    # One bit per compressed tick (tick // tick_spacing); word w holds compressed ticks
+    # [w * 256, w * 256 + 256) as a Python int. Empty words are not stored.
+    def __init__(self):
+        self.words = {}
+
+    def flip(self, compressed):
+
+        word, bit = compressed >> 8, compressed & (WORD_BITS - 1)
+        value = self.words.get(word, 0) ^ (1 << bit)
+        if value:
+            self.words[word] = value
+        else:
+            del self.words[word]
+
+    def next_in_word(self, compressed, lte):
+
+        # Nearest initialized compressed tick at or below `compressed` (lte) or strictly above it,
+        # looking in one word only. Returns (compressed tick, initialized); if the word has none,
+        # the word's last tick in the search direction with initialized False.
+        if lte:
+            word, bit = compressed >> 8, compressed & (WORD_BITS - 1)
+            masked = self.words.get(word, 0) & ((2 << bit) - 1)
+            if masked:
+                return (word << 8) + masked.bit_length() - 1, True
+            return word << 8, False
+        compressed += 1
+        word, bit = compressed >> 8, compressed & (WORD_BITS - 1)
+        masked = self.words.get(word, 0) >> bit << bit
+        if masked:
+            return (word << 8) + (masked & -masked).bit_length() - 1, True
+        return (word << 8) + WORD_BITS - 1, False
+
+
+class ConcentratedLiquidityAMM:
+    def __init__(self, price, tick_spacing=10):
+        # money and power are the token balances the pool holds; the curve state is sqrt_price,
+        # tick (greatest tick at or below the price) and the liquidity active at that price.
+        self.tick_spacing = tick_spacing
+        self.sqrt_price = math.sqrt(price)
+        self.tick = tick_at(self.sqrt_price)
+        self.liquidity = 0.0
+        self.liquidity_net = {}
+        self.liquidity_gross = {}
+        self.positions = {}
+        self.bitmap = TickBitmap()
+        self.money = 0.0
+        self.power = 0.0
+        self._bounds = None
+
+    @classmethod
+    def from_reserves(cls, money, power, lower_price, upper_price, tick_spacing=10):
+
+        # One position holding at most `money` and `power` on [lower_price, upper_price], at the
+        # spot price money / power like a UniswapV2AMM with the same reserves.
+        pool = cls(money / power, tick_spacing)
+        lower = math.floor(math.log(lower_price) / _LOG_BASE / tick_spacing) * tick_spacing
+        upper = math.ceil(math.log(upper_price) / _LOG_BASE / tick_spacing) * tick_spacing
+        s, sa, sb = pool.sqrt_price, sqrt_price_at(lower), sqrt_price_at(upper)
+        pool.add_liquidity(lower, upper, min(power / (1 / s - 1 / sb), money / (s - sa)))
+        return pool
+
+    @property
+    def price(self):
+
+        return self.sqrt_price ** 2
+
+    def _update_tick(self, tick, gross_delta, net_delta):
+
+        gross = self.liquidity_gross.get(tick, 0.0) + gross_delta
+        if gross <= DUST:
+            if tick in self.liquidity_gross:
+                del self.liquidity_gross[tick]
+                del self.liquidity_net[tick]
+                self.bitmap.flip(tick // self.tick_spacing)
+        else:
+            if tick not in self.liquidity_gross:
+                self.bitmap.flip(tick // self.tick_spacing)
+            self.liquidity_gross[tick] = gross
+            self.liquidity_net[tick] = self.liquidity_net.get(tick, 0.0) + net_delta
+        self._bounds = None
+
+    def _amounts(self, lower, upper, liquidity):
+
+        # (power, money) backing `liquidity` on [lower, upper) at the current price.
+        sa, sb = sqrt_price_at(lower), sqrt_price_at(upper)
+        s = min(max(self.sqrt_price, sa), sb)
+        return liquidity * (1 / s - 1 / sb), liquidity * (s - sa)
+
+    def add_liquidity(self, lower, upper, liquidity):
+
+        # Returns the (power, money) deposited.
+        if not MIN_TICK <= lower < upper <= MAX_TICK or lower % self.tick_spacing or upper % self.tick_spacing:
+            raise ValueError(f"invalid tick range [{lower}, {upper}) for spacing {self.tick_spacing}")
+        if liquidity <= 0:
+            raise ValueError("liquidity must be positive")
+        self._update_tick(lower, liquidity, liquidity)
+        self._update_tick(upper, liquidity, -liquidity)
+        self.positions[lower, upper] = self.positions.get((lower, upper), 0.0) + liquidity
+        if lower <= self.tick < upper:
+            self.liquidity += liquidity
+        power, money = self._amounts(lower, upper, liquidity)
+        self.power += power
+        self.money += money
+        return power, money
+
+    def remove_liquidity(self, lower, upper, liquidity):
+
+        # Returns the (power, money) withdrawn.
+        held = self.positions.get((lower, upper), 0.0)
+        if liquidity <= 0 or liquidity > held + DUST:
+            raise ValueError(f"position [{lower}, {upper}) holds {held} liquidity, cannot remove {liquidity}")
+        if held - liquidity <= DUST:
+            del self.positions[lower, upper]
+        else:
+            self.positions[lower, upper] = held - liquidity
+        self._update_tick(lower, -liquidity, -liquidity)
+        self._update_tick(upper, -liquidity, liquidity)
+        if lower <= self.tick < upper:
+            self.liquidity = max(self.liquidity - liquidity, 0.0)
+        power, money = self._amounts(lower, upper, liquidity)
+        self.power -= power
+        self.money -= money
+        return power, money
+
+    def _tick_bounds(self):
+
+        if self._bounds is None:
+            ticks = self.liquidity_gross
+            self._bounds = (min(ticks), max(ticks)) if ticks else (MAX_TICK, MIN_TICK)
+        return self._bounds
+
+    def _swap(self, amount, up, exact_power, commit):
+
+        # Moves the price up (power out, money in) or down (power in, money out) until `amount` of
+        # power (exact_power) or of money has been traded, crossing initialized ticks on the way.
+        # Returns (power, money) traded, or None if liquidity runs out first. The pool state only
+        # changes when commit is set.
+        started = instrumentation.enabled and time.perf_counter()
+        spacing, bitmap, liquidity_net = self.tick_spacing, self.bitmap, self.liquidity_net
+        s, tick, liquidity = self.sqrt_price, self.tick, self.liquidity
+        lowest, highest = self._tick_bounds()
+        remaining = amount
+        power = money = 0.0
+        crossed = 0
+
+        while remaining > DUST:
+            compressed, initialized = bitmap.next_in_word(tick // spacing, lte=not up)
+            next_tick = min(max(compressed * spacing, MIN_TICK), MAX_TICK)
+            if liquidity <= DUST and (next_tick > highest if up else next_tick < lowest) or \
+                    (tick >= MAX_TICK if up else tick < MIN_TICK):
+                return None
+            s_next = sqrt_price_at(next_tick)
+            if liquidity <= DUST:
+                reach = 0.0
+            elif exact_power:
+                reach = liquidity * abs(1 / s - 1 / s_next)
+            else:
+                reach = liquidity * abs(s_next - s)
+
+            if reach > remaining:
+                # The trade finishes inside this range.
+                if exact_power:
+                    s_new = 1 / (1 / s - remaining / liquidity) if up else 1 / (1 / s + remaining / liquidity)
+                else:
+                    s_new = s + remaining / liquidity if up else s - remaining / liquidity
+                power += liquidity * abs(1 / s - 1 / s_new)
+                money += liquidity * abs(s_new - s)
+                if up:
+                    tick = min(max(tick_at(s_new), tick), next_tick - 1)
+                else:
+                    tick = min(max(tick_at(s_new), next_tick), tick)
+                s = s_new
+                break
+
+            power += liquidity * abs(1 / s - 1 / s_next)
+            money += liquidity * abs(s_next - s)
+            remaining -= reach
+            s = s_next
+            if initialized:
+                liquidity += liquidity_net[next_tick] if up else -liquidity_net[next_tick]
+                crossed += 1
+            tick = next_tick if up else next_tick - 1
+
+        if commit:
+            self.sqrt_price, self.tick, self.liquidity = s, tick, max(liquidity, 0.0)
+        if started:
+            instrumentation.record("amm.concentrated_swap", started, ticks_crossed=crossed)
+        return power, money
+
+    def get_price_for_power(self, power_demand):
+
+        # Money paid in to take power_demand out of the pool; inf if the pool cannot supply it.
+        # Unlike UniswapV2AMM there is no 1-money minimum.
+        swap = self._swap(power_demand, up=True, exact_power=True, commit=False)
+        return float('inf') if swap is None else swap[1]
+
+    def get_power_for_money(self, money_received):
+
+        # Power taken out for money_received paid in; inf if the pool cannot supply it.
+        swap = self._swap(money_received, up=True, exact_power=False, commit=False)
+        return float('inf') if swap is None else swap[0]
+
+    def get_money_for_power(self, power_provided):
+
+        # Money paid out for power_provided put into the pool; inf if the pool cannot absorb it.
+        swap = self._swap(power_provided, up=False, exact_power=True, commit=False)
+        return float('inf') if swap is None else swap[1]
+
+    def update_pool_buy(self, power_demand, money_paid):
+
+        # The price moves along the curve for power_demand; money_paid is credited as given, as
+        # in UniswapV2AMM, so any amount above the curve cost stays in the pool's balance.
+        if self._swap(power_demand, up=True, exact_power=True, commit=True) is None:
+            raise ValueError(f"insufficient liquidity to supply {power_demand} power")
+        self.power -= power_demand
+        self.money += money_paid
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates")
+
+    def update_pool_sell(self, power_provided, money_received):
+
+        if self._swap(power_provided, up=False, exact_power=True, commit=True) is None:
+            raise ValueError(f"insufficient liquidity to absorb {power_provided} power")
+        self.power += power_provided
+        self.money -= money_received
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates")
+
+
+if __name__ == "__main__":
+    import random
+
+    from Dijkstra import UniswapV2AMM
+
+    # The same capital full range and within +/-5% of the spot price.
+    full_range = UniswapV2AMM(initial_money=100000, initial_power=100000)
+    concentrated = ConcentratedLiquidityAMM.from_reserves(100000, 100000, 0.95, 1.05)
+    for demand in (100, 1000, 10000):
+        v2, v3 = full_range.get_price_for_power(demand), concentrated.get_price_for_power(demand)
+        print(f"buy {demand:>6} power: full range {v2 / demand:.4f}/unit, concentrated {v3 / demand:.4f}/unit")
+
+    # Many narrow positions, then a swap across most of them.
+    rng = random.Random(0)
+    ladder = ConcentratedLiquidityAMM(1.0, tick_spacing=10)
+    for _ in range(10000):
+        lower = rng.randrange(-5000, 5000) // 10 * 10
+        ladder.add_liquidity(lower, lower + 10 * rng.randint(1, 20), rng.uniform(1e4, 1e5))
+    instrumentation.enable()
+    for _ in range(100):
+        ladder.get_price_for_power(ladder.power * 0.4)
+    phase = instrumentation.snapshot()['phases']['amm.concentrated_swap']
+    print(f"10000 positions: {instrumentation.counters['ticks_crossed'] // phase['calls']} ticks crossed per quote, "
+          f"{phase['seconds'] / phase['calls'] * 1e6:.0f} us per quote")
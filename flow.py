@@ -0,0 +1,93 @@
+import numpy as np
+
+EPSILON = 1e-9
+
+
+def transportation(supply, demand, cost):
+
+    # Min-cost max-flow from S supplies to B demands over a dense (S, B) unit-cost matrix, inf where
+    # there is no arc; returns the (S, B) flow matrix. Successive shortest paths with potentials u
+    # (supplies), v (demands) and sink_potential, reduced cost cost + u - v, on the residual graph
+    # kept implicitly by the matrices: every s -> b arc is uncapacitated, b -> s exists where
+    # flow > 0, and a demand with room left reaches the sink at v - sink_potential. Each
+    # Dijkstra step relaxes a whole row or column in NumPy, so the Python loop only runs once per
+    # settled node, and searches start from every unexhausted supply at once.
+    supply = np.array(supply, dtype=np.float64)
+    demand = np.array(demand, dtype=np.float64)
+    cost = np.asarray(cost, dtype=np.float64)
+    S, B = cost.shape
+    inf = float('inf')
+    flow = np.zeros((S, B))
+    u = np.zeros(S)
+    v = cost.min(axis=0, initial=inf)
+    v[~np.isfinite(v)] = 0.0
+    sink_potential = v.min(initial=0.0)
+    # Supplies with energy left always sit at distance 0, so their u never changes and the
+    # column-wise minimum over them only needs recomputing when one runs out.
+    sources = supply > EPSILON
+    source_min = source_arg = None
+
+    while sources.any() and (demand > EPSILON).any():
+        if source_min is None:
+            rows = np.flatnonzero(sources)
+            reduced = cost[rows] + u[rows, None]
+            source_arg = rows[reduced.argmin(axis=0)]
+            source_min = reduced.min(axis=0)
+
+        dist_b = np.maximum(source_min - v, 0.0)
+        pred_b = source_arg.copy()
+        dist_s = np.where(sources, 0.0, inf)
+        pred_s = np.full(S, -1)
+        open_b = np.isfinite(dist_b)
+        open_s = np.zeros(S, dtype=bool)
+        settled_s = sources.copy()
+        settled_b = np.zeros(B, dtype=bool)
+        dist_t, target = inf, -1
+        while True:
+            b = int(np.argmin(np.where(open_b, dist_b, inf))) if open_b.any() else -1
+            s = int(np.argmin(np.where(open_s, dist_s, inf))) if open_s.any() else -1
+            if dist_t <= min(dist_b[b] if b >= 0 else inf, dist_s[s] if s >= 0 else inf):
+                break
+            if s < 0 or b >= 0 and dist_b[b] <= dist_s[s]:
+                open_b[b], settled_b[b] = False, True
+                if demand[b] > EPSILON and dist_b[b] + max(v[b] - sink_potential, 0.0) < dist_t:
+                    dist_t, target = dist_b[b] + max(v[b] - sink_potential, 0.0), b
+                # Reverse arcs b -> s undo flow; their reduced cost is 0 up to rounding.
+                back = (flow[:, b] > EPSILON) & ~settled_s
+                candidate = dist_b[b] + np.maximum(v[b] - cost[:, b] - u, 0.0)
+                better = back & (candidate < dist_s)
+                dist_s[better], pred_s[better], open_s[better] = candidate[better], b, True
+            else:
+                open_s[s], settled_s[s] = False, True
+                candidate = dist_s[s] + np.maximum(cost[s] + u[s] - v, 0.0)
+                better = ~settled_b & (candidate < dist_b)
+                dist_b[better], pred_b[better], open_b[better] = candidate[better], s, True
+        if target < 0:
+            break
+
+        limit = dist_t
+        u += np.minimum(np.where(settled_s, dist_s, limit), limit)
+        v += np.minimum(np.where(settled_b, dist_b, limit), limit)
+        sink_potential += limit
+
+        # Walk back from the demand to its supply, alternating forward and reverse arcs.
+        forward, backward = [], []
+        b = target
+        while True:
+            s = int(pred_b[b])
+            forward.append((s, b))
+            if pred_s[s] < 0:
+                break
+            b = int(pred_s[s])
+            backward.append((s, b))
+        amount = min(supply[s], demand[target], min((flow[arc] for arc in backward), default=inf))
+        for arc in forward:
+            flow[arc] += amount
+        for arc in backward:
+            flow[arc] -= amount
+        supply[s] -= amount
+        demand[target] -= amount
+        if supply[s] <= EPSILON:
+            sources[s] = False
+            source_min = None
+    return flow
@@ -0,0 +1,56 @@
+# Process-wide counters and phase timers for the routing, matching and AMM hot paths.
+# Call sites guard on `enabled` and report once per call, so a disabled run pays one flag check.
+#
+#     started = instrumentation.enabled and time.perf_counter()
+#     ...
+#     if started:
+#         instrumentation.record("routing.search", started, nodes_settled=len(settled))
+import time
+
+enabled = False
+counters = {}
+phases = {}
+
+
+def enable():
+
+    global enabled
+    enabled = True
+
+
+def disable():
+
+    global enabled
+    enabled = False
+
+
+def reset():
+
+    counters.clear()
+    phases.clear()
+
+
+def count(name, amount=1):
+
+    counters[name] = counters.get(name, 0) + amount
+
+
+def record(phase, started, **counts):
+
+    elapsed = time.perf_counter() - started
+    totals = phases.get(phase)
+    if totals is None:
+        totals = phases[phase] = [0, 0.0]
+    totals[0] += 1
+    totals[1] += elapsed
+    for name, amount in counts.items():
+        counters[name] = counters.get(name, 0) + amount
+
+
+def snapshot():
+
+    return {
+        'enabled': enabled,
+        'counters': dict(counters),
+        'phases': {phase: {'calls': calls, 'seconds': seconds} for phase, (calls, seconds) in phases.items()},
+    }
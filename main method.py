@@ -1,4 +1,10 @@
-import heapq
+import random
+import sys
+import time
+
+import instrumentation
+from routing import RouteCache, dijkstra, route_cache_for
+from trade_log import ConsoleSink, TradeLog
 
 
 class UniswapV2AMM:
@@ -32,47 +38,35 @@ class UniswapV2AMM:
         self.power -= power_demand
         self.money += money_paid
         self.k = self.money * self.power
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates")
 
     def update_pool_sell(self, power_provided, money_received):
 
         self.power += power_provided
         self.money -= money_received
         self.k = self.money * self.power
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates")
 
 
-def dijkstra(paths_graph, start, end):
-
-    queue = [(0, start, [])]
-    visited = set()
-
-    while queue:
-        total_loss, node, path = heapq.heappop(queue)
-
-        if node in visited:
-            continue
-        visited.add(node)
-
-        path = path + [node]
-
-        if node == end:
-            return total_loss, path
-
-        for neighbor, loss in paths_graph.get(node, []):
-            if neighbor not in visited:
-                heapq.heappush(queue, (total_loss + loss, neighbor, path))
-
-    return float('inf'), []
-
-
-def find_best_amm_and_path(amms, demand, paths_graph, start_node, end_nodes, is_buying):
+def find_best_amm_and_path(amms, demand, paths_graph, start_node, end_nodes, is_buying, route_cache=None):
+    started = instrumentation.enabled and time.perf_counter()
     best_total_cost = float('inf')
     best_amm = None
     best_path = None
     best_loss = 0
 
+    # Routes are cached per paths_graph (route_cache, or a shared default from route_cache_for)
+    # and are not recomputed when paths_graph is edited in place: change losses through
+    # route_cache.update_edge_loss, or call its invalidate() after any other edit.
+    if route_cache is None or route_cache.graph is not paths_graph:
+        route_cache = route_cache_for(paths_graph)
+    routes = route_cache.get(start_node, end_nodes[:len(amms)])
+
     for amm, end_node in zip(amms, end_nodes):
 
-        total_loss, path = dijkstra(paths_graph, start_node, end_node)
+        total_loss, path = routes.get(end_node, (float('inf'), []))
 
 
         if total_loss == float('inf') or path[-1] != end_node:
@@ -85,6 +79,10 @@ def find_best_amm_and_path(amms, demand, paths_graph, start_node, end_nodes, is_
         else:
 
             effective_money = demand / (1 - total_loss)
+            # Pools that quote sells (ConcentratedLiquidityAMM) are skipped when they cannot absorb it.
+            quote_sell = getattr(amm, 'get_money_for_power', None)
+            if quote_sell is not None and quote_sell(effective_money) == float('inf'):
+                continue
             cost = effective_money
 
 
@@ -96,14 +94,45 @@ def find_best_amm_and_path(amms, demand, paths_graph, start_node, end_nodes, is_
             best_path = path
             best_loss = total_loss
 
+    if started:
+        instrumentation.record("amm.find_best_amm_and_path", started, amm_quotes=min(len(amms), len(end_nodes)))
     return best_amm, best_path, best_total_cost, best_loss
 
 
+def execute_trade(amms, demand, paths_graph, start_node, end_nodes, is_buying, route_cache=None):
+
+    best_amm, best_path, best_cost, best_loss = find_best_amm_and_path(
+        amms, demand, paths_graph, start_node, end_nodes, is_buying, route_cache=route_cache
+    )
+    if best_amm is None:
+        return None
+
+    if is_buying:
+        best_amm.update_pool_buy(demand / (1 - best_loss), best_cost)
+    else:
+        best_amm.update_pool_sell(demand / (1 - best_loss), best_cost)
+
+    return {
+        'amm': next(i for i, amm in enumerate(amms) if amm is best_amm),
+        'path': best_path,
+        'cost': best_cost,
+        'loss': best_loss,
+        'received': demand * (1 - best_loss)
+    }
+
+
 if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    seed = int(args[0]) if args else 0
+    rng = random.Random(seed)
+    sinks = [TradeLog(f"trades_{seed}.bin")]
+    if "--print" in sys.argv:
+        sinks.append(ConsoleSink())
+
     amms = [
-        UniswapV2AMM(initial_money=, initial_power=),
-        UniswapV2AMM(initial_money=, initial_power=),
-        UniswapV2AMM(initial_money=, initial_power=)
+        UniswapV2AMM(initial_money=1000, initial_power=1000),
+        UniswapV2AMM(initial_money=1000, initial_power=1000),
+        UniswapV2AMM(initial_money=1000, initial_power=1000)
     ]
 
 
@@ -113,44 +142,19 @@ if __name__ == "__main__":
 
     start_node = "user"
     end_nodes = ["amm1"]
+    route_cache = RouteCache(paths_graph)
 
 
     for user_id in range(1, 101):
-        is_buying = choice([True, False])
-        demand = uniform()
-
-        if is_buying:
-
-            best_amm, best_path, best_cost, best_loss = find_best_amm_and_path(
-                amms, demand, paths_graph, start_node, end_nodes, is_buying=True
-            )
-        else:
-
-            best_amm, best_path, best_cost, best_loss = find_best_amm_and_path(
-                amms, demand, paths_graph, start_node, end_nodes, is_buying=False
-            )
-
-        if best_amm is None:
-            print(f"第{user_id}次交易失败，没有可用路径或满足需求的 AMM。")
-            continue
-
-        if is_buying:
-
-            actual_power_received = demand * (1 - best_loss)
-            best_amm.update_pool_buy(demand / (1 - best_loss), best_cost)
-            print(f"第{user_id}次交易：用户买电，买入 {demand:.2f} 电力token，实际获得 {actual_power_received:.2f} 电力token，"
-                  f"最佳路径是 {best_path}，需要 {best_cost:.2f} Money token，损耗了 {best_loss:.2%}")
-        else:
+        is_buying = rng.choice([True, False])
+        demand = rng.uniform(1, 10)
 
-            actual_money_received = demand * (1 - best_loss)
-            best_amm.update_pool_sell(demand / (1 - best_loss), best_cost)
-            print(f"第{user_id}次交易：用户卖电，卖出 {demand:.2f} 电力token，实际获得 {actual_money_received:.2f} Money token，"
-                  f"最佳路径是 {best_path}，损耗了 {best_loss:.2%}")
+        trade = execute_trade(amms, demand, paths_graph, start_node, end_nodes, is_buying, route_cache=route_cache)
+        for sink in sinks:
+            sink.record(user_id, is_buying, demand, trade, amms)
 
-        print(f"交易后 AMM 状态:")
-        for i, amm in enumerate(amms):
-            print(f"AMM {i} -> 剩余Electricity token: {amm.power:.2f}，剩余Money token: {amm.money:.2f}")
-        print("----")
+    for sink in sinks:
+        sink.close()
 
     print("\n最终 AMM 状态:")
     for i, amm in enumerate(amms):
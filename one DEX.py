@@ -1,6 +1,14 @@
 import numpy as np
 from collections import defaultdict
+from collections.abc import Mapping
 import heapq
+from itertools import islice
+import sys
+import time
+
+import instrumentation
+from routing import bidirectional_search, landmark_bound, reconstruct_path
+from streams import demand_stream, windows
 
 class AutomatedMarketMaker:
     def __init__(self, reserve_x, reserve_y):
@@ -17,115 +25,452 @@ class AutomatedMarketMaker:
         delta_y = self.get_price(delta_x)
         self.reserve_x += delta_x
         self.reserve_y -= delta_y
+        if instrumentation.enabled:
+            instrumentation.count("amm_updates")
         return delta_y
 
 class User:
+    __slots__ = ('id', 'power_demand', 'funds')
+
     def __init__(self, id, power_demand, funds):
         self.id = id
         self.power_demand = power_demand 
         self.funds = funds  
 
 class StorageUnit:
+    __slots__ = ('id', 'capacity')
+
     def __init__(self, id, capacity):
         self.id = id
         self.capacity = capacity  
 
+class _DistanceView(Mapping):
+    # Read-only name -> loss view over the graph's reusable distance buffer.
+    def __init__(self, graph, query):
+        self.graph = graph
+        self.query = query
+
+    def _check(self):
+        if self.query != self.graph._query:
+            raise RuntimeError("search result was overwritten by a later Graph.dijkstra call")
+
+    def __getitem__(self, node):
+        self._check()
+        return self.graph._dist[self.graph.node_ids[node]]
+
+    def __iter__(self):
+        return iter(self.graph.node_names)
+
+    def __len__(self):
+        return len(self.graph.node_names)
+
+class _PredecessorView(_DistanceView):
+    def __getitem__(self, node):
+        self._check()
+        previous = self.graph._prev[self.graph.node_ids[node]]
+        return None if previous < 0 else self.graph.node_names[previous]
+
 class Graph:
     def __init__(self):
-        self.edges = defaultdict(list)  
-        self.nodes = set()  
+        # Nodes are interned to integer ids; edges live in CSR arrays built on first query.
+        self.node_ids = {}
+        self.node_names = []
+        self._src = []
+        self._dst = []
+        self._loss = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.loss = np.zeros(0, dtype=np.float64)
+        self._row_bounds = [0]
+        self._dist = []
+        self._prev = []
+        self._touched = []
+        self._query = 0
+        # ALT landmarks for the current topology: (n, k) losses from / to each landmark.
+        self.landmark_ids = None
+        self.landmark_from = None
+        self.landmark_to = None
+        self._reverse = None
+        # Bumped by add_edge and update_edge_loss, so caches over search results can tell when
+        # the losses they were computed from changed.
+        self.version = 0
+
+    @classmethod
+    def from_csr(cls, node_names, indptr, indices, loss):
+        # Adopts prebuilt (possibly memory-mapped) CSR arrays without copying them.
+        graph = cls()
+        graph.node_names = list(node_names)
+        graph.node_ids = {node: i for i, node in enumerate(graph.node_names)}
+        graph.indptr, graph.indices, graph.loss = indptr, indices, loss
+        graph._reset_buffers()
+        return graph
+
+    @property
+    def nodes(self):
+        return self.node_ids.keys()
+
+    @property
+    def edges(self):
+        self._build()
+        names = self.node_names
+        adjacency = defaultdict(list)
+        for i, name in enumerate(names):
+            lo, hi = self.indptr[i], self.indptr[i + 1]
+            adjacency[name] = [(names[j], loss) for j, loss in zip(self.indices[lo:hi].tolist(), self.loss[lo:hi].tolist())]
+        return adjacency
+
+    def _node_id(self, node):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            node_id = self.node_ids[node] = len(self.node_names)
+            self.node_names.append(node)
+        return node_id
 
     def add_edge(self, from_node, to_node, loss):
-        self.edges[from_node].append((to_node, loss))
-        self.nodes.add(from_node)
-        self.nodes.add(to_node)
+        self._src.append(self._node_id(from_node))
+        self._dst.append(self._node_id(to_node))
+        self._loss.append(loss)
+        self.version += 1
+
+    def _build(self):
+        n = len(self.node_names)
+        if not self._src and len(self.indptr) == n + 1:
+            return
+
+        # Merge pending edges into the CSR arrays, keeping insertion order within each row.
+        old_src = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        src = np.concatenate([old_src, np.asarray(self._src, dtype=np.int64)])
+        dst = np.concatenate([self.indices, np.asarray(self._dst, dtype=np.int64)])
+        loss = np.concatenate([self.loss, np.asarray(self._loss, dtype=np.float64)])
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.loss = loss[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self._src, self._dst, self._loss = [], [], []
+        self._reset_buffers()
+        # New edges can shorten losses, so landmark bounds from the old topology are no longer valid.
+        self.landmark_ids = self.landmark_from = self.landmark_to = self._reverse = None
+
+    def _reset_buffers(self):
+        n = len(self.node_names)
+        # Plain-int copy of indptr for the search loop; indexing NumPy scalars per node is slow.
+        self._row_bounds = self.indptr.tolist()
+        self._dist = [float('inf')] * n
+        self._prev = [-1] * n
+        self._touched = []
 
     def dijkstra(self, start):
-        pq = [(0, start)] 
-        shortest_paths = {node: float('inf') for node in self.nodes}
-        shortest_paths[start] = 0
-        previous_nodes = {node: None for node in self.nodes}
-        visited = set()
+        started = instrumentation.enabled and time.perf_counter()
+        start_id = self._node_id(start)
+        self._build()
+        indptr, indices, edge_loss = self._row_bounds, self.indices, self.loss
+        dist, prev = self._dist, self._prev
+
+        # Reset only the entries written by the previous query.
+        for node in self._touched:
+            dist[node] = float('inf')
+            prev[node] = -1
+        touched = self._touched = [start_id]
+        self._query += 1
+
+        dist[start_id] = 0
+        pq = [(0, start_id)]
+        settled = pushes = 0
 
         while pq:
             current_loss, current_node = heapq.heappop(pq)
 
-            if current_node in visited:
+            if current_loss > dist[current_node]:
                 continue
-            visited.add(current_node)
+            settled += 1
 
-            for neighbor, loss in self.edges[current_node]:
+            lo, hi = indptr[current_node], indptr[current_node + 1]
+            for neighbor, loss in zip(indices[lo:hi].tolist(), edge_loss[lo:hi].tolist()):
                 new_loss = current_loss + loss
-                if new_loss < shortest_paths[neighbor]:
-                    shortest_paths[neighbor] = new_loss
-                    previous_nodes[neighbor] = current_node
+                if new_loss < dist[neighbor]:
+                    if dist[neighbor] == float('inf'):
+                        touched.append(neighbor)
+                    dist[neighbor] = new_loss
+                    prev[neighbor] = current_node
                     heapq.heappush(pq, (new_loss, neighbor))
+                    pushes += 1
+
+        if started:
+            instrumentation.record("graph.dijkstra", started, nodes_settled=settled, edges_relaxed=pushes,
+                                   heap_pushes=pushes + 1, heap_pops=pushes + 1)
+        return _DistanceView(self, self._query), _PredecessorView(self, self._query)
+
+    def update_edge_loss(self, from_node, to_node, loss):
+        # Sets the loss of every from_node -> to_node edge in place. Landmark bounds stay valid
+        # when losses only grow, so they are dropped on decreases alone.
+        self._build()
+        u, v = self.node_ids[from_node], self.node_ids[to_node]
+        lo, hi = self._row_bounds[u], self._row_bounds[u + 1]
+        positions = lo + np.flatnonzero(self.indices[lo:hi] == v)
+        if not len(positions):
+            raise KeyError((from_node, to_node))
+        if not self.loss.flags.writeable:
+            # Memory-mapped from a snapshot; detach before writing.
+            self.loss = self.loss.copy()
+        decreased = loss < self.loss[positions].min()
+        self.loss[positions] = loss
+        self.version += 1
+        if self._reverse is not None:
+            reverse = self._reverse
+            lo, hi = reverse._row_bounds[v], reverse._row_bounds[v + 1]
+            reverse.loss[lo + np.flatnonzero(reverse.indices[lo:hi] == u)] = loss
+        if decreased:
+            self.landmark_ids = self.landmark_from = self.landmark_to = None
+
+    def _adjacent(self, node):
+        lo, hi = self._row_bounds[node], self._row_bounds[node + 1]
+        return zip(self.indices[lo:hi].tolist(), self.loss[lo:hi].tolist())
 
-        return shortest_paths, previous_nodes
+    def _reversed(self):
+        # Transposed CSR sharing this graph's node tables, for backward searches.
+        self._build()
+        n = len(self.node_names)
+        reverse = Graph()
+        reverse.node_ids, reverse.node_names = self.node_ids, self.node_names
+        src = np.repeat(np.arange(n), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        reverse.indices, reverse.loss = src[order], self.loss[order]
+        reverse.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=n), out=reverse.indptr[1:])
+        reverse._reset_buffers()
+        return reverse
+
+    def build_landmarks(self, count=8, seed=0):
+        # One-off ALT preprocessing for shortest_path: farthest-point landmark selection, then a
+        # forward and a backward full search from each landmark.
+        self._build()
+        n = len(self.node_names)
+        reverse = self._reverse = self._reversed()
+        landmark_ids = []
+        landmark_from = np.full((n, min(count, n)), np.inf)
+        landmark_to = np.full((n, min(count, n)), np.inf)
+        if n:
+            self.dijkstra(self.node_names[int(np.random.default_rng(seed).integers(n))])
+            seed_dist = np.array(self._dist)
+            landmark = int(np.argmax(np.where(np.isfinite(seed_dist), seed_dist, -1)))
+            closest = np.full(n, np.inf)
+            for i in range(landmark_from.shape[1]):
+                landmark_ids.append(landmark)
+                self.dijkstra(self.node_names[landmark])
+                landmark_from[:, i] = self._dist
+                reverse.dijkstra(self.node_names[landmark])
+                landmark_to[:, i] = reverse._dist
+                np.minimum(closest, landmark_from[:, i], out=closest)
+                landmark = int(np.argmax(closest))
+                if closest[landmark] == 0:
+                    break
+        k = len(landmark_ids)
+        self.landmark_ids = np.array(landmark_ids, dtype=np.int64)
+        self.landmark_from = np.ascontiguousarray(landmark_from[:, :k])
+        self.landmark_to = np.ascontiguousarray(landmark_to[:, :k])
+
+    def _landmark_potential(self, start_id, end_id):
+        inf = float('inf')
+        landmark_from, landmark_to = self.landmark_from, self.landmark_to
+        from_start, to_start = landmark_from[start_id].tolist(), landmark_to[start_id].tolist()
+        from_end, to_end = landmark_from[end_id].tolist(), landmark_to[end_id].tolist()
+        cache = {}
+
+        def potential(node):
+            if node in cache:
+                return cache[node]
+            from_node, to_node = landmark_from[node].tolist(), landmark_to[node].tolist()
+            to_target = landmark_bound(from_node, to_node, from_end, to_end)
+            from_source = landmark_bound(from_start, to_start, from_node, to_node)
+            value = cache[node] = None if inf in (to_target, from_source) else (to_target - from_source) / 2
+            return value
+        return potential
+
+    def shortest_path(self, start, end):
+        # Point-to-point (loss, path), the same as dijkstra + reconstruct_path: bidirectional ALT
+        # after build_landmarks, plain bidirectional Dijkstra otherwise. The loss is re-accumulated
+        # along the path in forward order so it matches dijkstra bit for bit.
+        if start == end:
+            return 0, [start]
+        self._build()
+        start_id, end_id = self.node_ids.get(start), self.node_ids.get(end)
+        if start_id is None or end_id is None:
+            return float('inf'), []
+        started = instrumentation.enabled and time.perf_counter()
+        if self._reverse is None:
+            self._reverse = self._reversed()
+        if self.landmark_from is None:
+            potential = lambda node: 0.0
+        else:
+            potential = self._landmark_potential(start_id, end_id)
+
+        meet, (dist, _), (prev, next_hop), settled = bidirectional_search(
+            start_id, end_id, self._adjacent, self._reverse._adjacent, potential)
+        if started:
+            instrumentation.record("graph.shortest_path", started, nodes_settled=settled)
+        if meet is None:
+            return float('inf'), []
+
+        path = reconstruct_path(prev, start_id, meet)
+        total_loss = dist[meet]
+        node = meet
+        while node != end_id:
+            hop = next_hop[node]
+            total_loss += min(loss for neighbor, loss in self._adjacent(node) if neighbor == hop)
+            path.append(hop)
+            node = hop
+        return total_loss, [self.node_names[node] for node in path]
 
     def reconstruct_path(self, start, end, previous_nodes):
         path = []
         current_node = end
         while current_node is not None:
-            path.insert(0, current_node)
+            path.append(current_node)
             current_node = previous_nodes[current_node]
+        path.reverse()
         return path if path[0] == start else []
 
-users = [User(id=f"U{i}", power_demand=np.uniform(-10, 10), funds=) for i in range(30)]  
-storage_units = [StorageUnit(id=f"S{i}", capacity=) for i in range(10)]  
-intermediate_nodes = [f"N{i}" for i in range(50)]  
-graph = Graph()
-
-for user in users:
-    for node in np.choice(intermediate_nodes, size=10, replace=False): 
-        loss = np.uniform(0.1, 0.5)
-        graph.add_edge(user.id, node, loss)
-
-for node in intermediate_nodes:
-    for su in np.choice(storage_units, size=5, replace=False):  
-        loss = np.uniform(0.1, 0.5)
-        graph.add_edge(node, su.id, loss)
-
-for _ in range(100):  # 增加复杂连接
-    from_node, to_node = np.choice(intermediate_nodes, size=2, replace=False)
-    loss = np.uniform(0.05, 0.3)
-    graph.add_edge(from_node, to_node, loss)
-
-amm = AutomatedMarketMaker(reserve_x=20000, reserve_y=20000)
-
-for transaction_id in range(1, 101):
-    user = np.choice(users)  
-    if user.power_demand > 0:  
-        shortest_paths, previous_nodes = graph.dijkstra(user.id)
-        target_su = min((su.id for su in storage_units), key=lambda su_id: shortest_paths.get(su_id, float('inf')))
-        storage_unit = next(su for su in storage_units if su.id == target_su)
-        path = graph.reconstruct_path(user.id, target_su, previous_nodes)
-        loss = shortest_paths[target_su]
-
-        price = amm.get_price(user.power_demand)
-        if user.funds >= price and storage_unit.capacity >= user.power_demand:
-            user.funds -= price
-            storage_unit.capacity -= user.power_demand
-            amm.trade(user.power_demand)
-            print(f"第 {transaction_id} 次交易: {user.id} 从 {target_su} 购买 {user.power_demand:.2f} 电力")
-            print(f"路径: {' -> '.join(path)}，传输损耗: {loss:.2f}")
-            print(f"支付: {price:.2f} money token，剩余资金: {user.funds:.2f}")
-            print(f"交易所剩余: {amm.reserve_y:.2f} money token, {amm.reserve_x:.2f} electricity token\n")
-    elif user.power_demand < 0:  
-        shortest_paths, previous_nodes = graph.dijkstra(user.id)
-        target_su = min((su.id for su in storage_units), key=lambda su_id: shortest_paths.get(su_id, float('inf')))
-        storage_unit = next(su for su in storage_units if su.id == target_su)
-        path = graph.reconstruct_path(user.id, target_su, previous_nodes)
-        loss = shortest_paths[target_su]
-
-        
-        power_to_sell = -user.power_demand
-        price = amm.get_price(power_to_sell)
-        if storage_unit.capacity + power_to_sell <= 1000:
-            user.funds += price
-            storage_unit.capacity += power_to_sell
-            amm.trade(-power_to_sell)
-            print(f"第 {transaction_id} 次交易: {user.id} 向 {target_su} 出售 {power_to_sell:.2f} 电力")
-            print(f"路径: {' -> '.join(path)}，传输损耗: {loss:.2f}")
-            print(f"获得: {price:.2f} money token，总资金: {user.funds:.2f}")
-            print(f"交易所剩余: {amm.reserve_y:.2f} money token, {amm.reserve_x:.2f} electricity token\n")
+class StorageIndex:
+    # id -> StorageUnit plus, per user, the reachable storage units in the order a search from
+    # that user settles them, with their losses and paths. A buy needs capacity >= amount, a sell
+    # needs capacity + amount <= max_capacity; that check runs at lookup time against the cached
+    # order, so capacity changes and new amounts reuse it. The cache holds at most one entry per
+    # user and is dropped when the graph changes (Graph.version).
+    def __init__(self, graph, storage_units, max_capacity=1000):
+        self.graph = graph
+        self.units = {su.id: su for su in storage_units}
+        self.max_capacity = max_capacity
+        self.orders = {}
+        self.graph_version = graph.version
+
+    def invalidate(self):
+        self.orders.clear()
+        self.graph_version = self.graph.version
+
+    def update_edge_loss(self, from_node, to_node, loss):
+        self.graph.update_edge_loss(from_node, to_node, loss)
+        self.invalidate()
+
+    def fits(self, storage_unit, amount, is_buying):
+        if is_buying:
+            return storage_unit.capacity >= amount
+        return storage_unit.capacity + amount <= self.max_capacity
+
+    def storage_order(self, user_id):
+        # [(storage_unit, loss, path)] by increasing loss, ties broken by node id; one full
+        # Graph.dijkstra from the user the first time it is asked for.
+        if self.graph_version != self.graph.version:
+            self.invalidate()
+        order = self.orders.get(user_id)
+        if order is not None:
+            return order
+        graph = self.graph
+        order = []
+        if user_id in graph.node_ids:
+            dist, prev = graph.dijkstra(user_id)
+            ranked = sorted((dist[su_id], graph.node_ids[su_id], su_id) for su_id in self.units
+                            if su_id in graph.node_ids and dist[su_id] != float('inf'))
+            order = [(self.units[su_id], loss, graph.reconstruct_path(user_id, su_id, prev))
+                     for loss, _, su_id in ranked]
+        self.orders[user_id] = order
+        return order
+
+    def nearest(self, user_id, amount, is_buying):
+        # (storage_unit, loss, path) for the closest storage unit that can take the trade, or None.
+        for found in self.storage_order(user_id):
+            if self.fits(found[0], amount, is_buying):
+                return found
+        return None
+
+    def set_capacity(self, su_id, capacity):
+        self.units[su_id].capacity = capacity
+
+def trade_stream(demands, storage_index, amm, initial_funds=1000):
+    # Consumes (user_id, power_demand) pairs and yields one record per executed trade. Funds are
+    # kept only for users that have traded, so memory is bounded by the user count, not run length.
+    funds = {}
+    for transaction_id, (user_id, demand) in enumerate(demands, 1):
+        if demand == 0:
+            continue
+        is_buying = demand > 0
+        amount = abs(demand)
+        found = storage_index.nearest(user_id, amount, is_buying=is_buying)
+        price = amm.get_price(amount)
+        balance = funds.get(user_id, initial_funds)
+        if found is None or is_buying and balance < price:
+            continue
+
+        storage_unit, loss, path = found
+        if is_buying:
+            funds[user_id] = balance - price
+            storage_index.set_capacity(storage_unit.id, storage_unit.capacity - amount)
+            amm.trade(amount)
+        else:
+            funds[user_id] = balance + price
+            storage_index.set_capacity(storage_unit.id, storage_unit.capacity + amount)
+            amm.trade(-amount)
+        yield {
+            'transaction_id': transaction_id,
+            'user': user_id,
+            'storage': storage_unit.id,
+            'is_buying': is_buying,
+            'quantity': amount,
+            'money': price,
+            'loss': loss,
+            'path': path,
+            'funds': funds[user_id],
+            'reserve_x': amm.reserve_x,
+            'reserve_y': amm.reserve_y,
+        }
+
+if __name__ == "__main__":
+    # python "one DEX.py" [seed] [transactions] [window]; with a window, one summary line is printed
+    # per that many trades instead of one block per trade.
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    window = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    rng = np.random.default_rng(seed)
+
+    user_ids = [f"U{i}" for i in range(30)]
+    storage_units = [StorageUnit(id=f"S{i}", capacity=500) for i in range(10)]  
+    intermediate_nodes = [f"N{i}" for i in range(50)]  
+    graph = Graph()
+
+    for user_id in user_ids:
+        for node in rng.choice(intermediate_nodes, size=10, replace=False): 
+            loss = rng.uniform(0.1, 0.5)
+            graph.add_edge(user_id, node, loss)
+
+    for node in intermediate_nodes:
+        for su in rng.choice(storage_units, size=5, replace=False):  
+            loss = rng.uniform(0.1, 0.5)
+            graph.add_edge(node, su.id, loss)
+
+    for _ in range(100):  # 增加复杂连接
+        from_node, to_node = rng.choice(intermediate_nodes, size=2, replace=False)
+        loss = rng.uniform(0.05, 0.3)
+        graph.add_edge(from_node, to_node, loss)
+
+    amm = AutomatedMarketMaker(reserve_x=20000, reserve_y=20000)
+    storage_index = StorageIndex(graph, storage_units, max_capacity=1000)
+
+    # demand stream -> trades -> (windowed summaries) -> output, one item in flight at a time.
+    demands = islice(demand_stream(len(user_ids), seed=rng), transactions)
+    trades = trade_stream(demands, storage_index, amm)
+    if window:
+        for summary in windows(trades, window, carry=('transaction_id', 'reserve_x', 'reserve_y')):
+            print(f"截至第 {summary['transaction_id']} 次: {summary['trades']} 笔交易, 成交量 {summary['volume']:.2f}, "
+                  f"VWAP {summary['vwap']:.4f}, 传输损耗电量 {summary['loss']:.2f}, "
+                  f"交易所剩余: {summary['reserve_y']:.2f} money token, {summary['reserve_x']:.2f} electricity token")
+    else:
+        for trade in trades:
+            action = "从" if trade['is_buying'] else "向"
+            verb = "购买" if trade['is_buying'] else "出售"
+            print(f"第 {trade['transaction_id']} 次交易: {trade['user']} {action} {trade['storage']} {verb} {trade['quantity']:.2f} 电力")
+            print(f"路径: {' -> '.join(trade['path'])}，传输损耗: {trade['loss']:.2f}")
+            if trade['is_buying']:
+                print(f"支付: {trade['money']:.2f} money token，剩余资金: {trade['funds']:.2f}")
+            else:
+                print(f"获得: {trade['money']:.2f} money token，总资金: {trade['funds']:.2f}")
+            print(f"交易所剩余: {trade['reserve_y']:.2f} money token, {trade['reserve_x']:.2f} electricity token\n")
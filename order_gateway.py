@@ -0,0 +1,225 @@
+# Asyncio front end for OrderBook: many producers submit concurrently, one task owns the book.
+import asyncio
+import bisect
+import json
+import math
+import numbers
+import time
+from collections import defaultdict
+
+from script_loader import load_script
+
+order_book = load_script("order book.py")
+
+_STOP = object()
+
+
+def check_order(order):
+
+    # OrderBook trusts its input and a wrong type leaves its price index half updated, so the
+    # gateway rejects what it cannot match before it reaches the book.
+    for field in ('quantity', 'price'):
+        value = getattr(order, field)
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or not math.isfinite(value):
+            raise ValueError(f"{field} must be a finite number, got {value!r}")
+    if order.quantity <= 0:
+        raise ValueError(f"quantity must be positive, got {order.quantity!r}")
+    if not isinstance(order.is_buy, bool):
+        raise ValueError(f"is_buy must be a boolean, got {order.is_buy!r}")
+    if not isinstance(order.user, (str, int)) or isinstance(order.user, bool):
+        raise ValueError(f"user must be a string or integer, got {order.user!r}")
+    if not isinstance(order.order_type, str):
+        raise ValueError(f"order_type must be a string, got {order.order_type!r}")
+
+
+class LatencyHistogram:
+    # Log2-spaced microsecond buckets; bucket i counts latencies below 2**i us.
+    def __init__(self, buckets=24):
+        self.bounds = [2 ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.total = 0
+
+    def add(self, seconds):
+
+        self.counts[bisect.bisect_right(self.bounds, seconds * 1e6)] += 1
+        self.total += 1
+
+    def percentile(self, fraction):
+
+        if not self.total:
+            return None
+        rank = fraction * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+
+    def snapshot(self):
+
+        return {
+            'count': self.total,
+            'buckets_us': dict(zip(self.bounds + [float('inf')], self.counts)),
+            'p50_us': self.percentile(0.5),
+            'p99_us': self.percentile(0.99),
+        }
+
+
+class OrderGateway:
+    def __init__(self, book=None, max_pending=10000, batch_size=512):
+        self.book = book if book is not None else order_book.OrderBook()
+        # A bounded queue gives backpressure: submit() waits while max_pending orders are queued.
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.batch_size = batch_size
+        self.subscribers = []
+        # Transactions not delivered because a subscriber's queue was full.
+        self.dropped = 0
+        self.latency = LatencyHistogram()
+        self._task = None
+        self._stopping = False
+
+    async def start(self):
+
+        self._stopping = False
+        self._task = asyncio.create_task(self._match_loop())
+
+    async def stop(self):
+
+        # Orders already queued ahead of the stop are matched; submit() fails from here on, and
+        # anything that still got queued behind the stop is failed when the loop exits.
+        self._stopping = True
+        await self.queue.put((_STOP, None, None))
+        await self._task
+
+    async def submit(self, order):
+
+        # Resolves with the fills this order received in its own matching batch.
+        if self._stopping:
+            raise RuntimeError("gateway is stopping")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((order, time.perf_counter(), future))
+        return await future
+
+    def subscribe(self, maxsize=0):
+
+        # Matching never waits on a subscriber: with maxsize set, transactions that arrive while
+        # the queue is full are dropped for that subscriber and counted in self.dropped.
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+
+        self.subscribers.remove(queue)
+
+    async def _match_loop(self):
+
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            accepted = []
+            for order, submitted, future in batch:
+                if order is _STOP:
+                    stopping = True
+                    continue
+                if stopping:
+                    # Queued behind the stop.
+                    if not future.done():
+                        future.set_exception(RuntimeError("gateway stopped"))
+                    continue
+                try:
+                    check_order(order)
+                    self.book.add_order(order)
+                except Exception as error:
+                    # The submitter may have been cancelled meanwhile.
+                    if not future.done():
+                        future.set_exception(error)
+                    continue
+                accepted.append((order, submitted, future))
+
+            # A failure here fails the batch's orders; the loop keeps serving later ones.
+            try:
+                transactions = self.book.match_orders()
+            except Exception as error:
+                for order, submitted, future in accepted:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            fills = defaultdict(list)
+            for transaction in transactions:
+                fills[transaction['buy_order_id']].append(transaction)
+                fills[transaction['sell_order_id']].append(transaction)
+
+            now = time.perf_counter()
+            for order, submitted, future in accepted:
+                self.latency.add(now - submitted)
+                if not future.done():
+                    future.set_result(fills.get(order.order_id, []))
+
+            for subscriber in self.subscribers:
+                for transaction in transactions:
+                    try:
+                        subscriber.put_nowait(transaction)
+                    except asyncio.QueueFull:
+                        self.dropped += 1
+
+        while not self.queue.empty():
+            order, submitted, future = self.queue.get_nowait()
+            if order is not _STOP and not future.done():
+                future.set_exception(RuntimeError("gateway stopped"))
+
+    async def handle_client(self, reader, writer):
+
+        # JSON lines: {"user", "quantity", "price", "is_buy", "order_type"?} in, {"order_id", "fills"}
+        # or {"error"} out. A malformed line gets an error reply and the connection stays open.
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    missing = [key for key in ('user', 'quantity', 'price', 'is_buy') if key not in request]
+                    if missing:
+                        raise ValueError(f"missing fields: {', '.join(missing)}")
+                    order = order_book.Order(request['user'], request['quantity'], request['price'],
+                                             request.get('order_type', 'limit'), request['is_buy'])
+                    check_order(order)
+                    fills = await self.submit(order)
+                    response = {'order_id': order.order_id, 'fills': fills}
+                except Exception as error:
+                    response = {'error': str(error)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def serve_unix(self, path):
+
+        return await asyncio.start_unix_server(self.handle_client, path)
+
+
+if __name__ == "__main__":
+    async def demo():
+        gateway = OrderGateway()
+        gateway.book.add_path(order_book.Path("User1", "Storage1", 0.05))
+        await gateway.start()
+
+        fills = await asyncio.gather(
+            gateway.submit(order_book.Order("User1", 100, 50, "limit", True)),
+            gateway.submit(order_book.Order("Storage1", 100, 45, "limit", False)),
+        )
+        await gateway.stop()
+
+        for transaction in fills[0]:
+            print(f"Buyer: {transaction['buyer']}, Seller: {transaction['seller']}, "
+                  f"Quantity: {transaction['quantity']:.2f} kWh, Price: {transaction['price']}")
+        print(gateway.latency.snapshot())
+
+    asyncio.run(demo())
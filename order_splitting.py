@@ -0,0 +1,73 @@
+import numpy as np
+
+from amm_bank import AMMBank
+from routing import RouteCache
+
+
+def split_order(amms, losses, demand, is_buying):
+
+    # Water-filling over x*y=k pools: every pool that gets a fill ends at the same loss-adjusted
+    # marginal price (money per unit of power delivered to or taken from the user).
+    bank = AMMBank.from_amms(amms)
+    money, power, k = bank.money, bank.power, bank.k
+    keep = 1 - np.asarray(losses, dtype=np.float64)
+
+    if is_buying:
+        marginal = money / (power * keep)
+        order = np.argsort(marginal, kind='stable')
+        gap = np.cumsum((keep * power)[order]) - demand
+        weight = np.cumsum(np.sqrt(k * keep)[order])
+        with np.errstate(divide='ignore'):
+            level = np.where(gap > 0, (weight / gap) ** 2, np.inf)
+        next_marginal = np.append(marginal[order][1:], np.inf)
+        feasible = np.flatnonzero((gap > 0) & (level <= next_marginal))
+        if len(feasible) == 0:
+            return []
+        active = order[:feasible[0] + 1]
+        water = level[feasible[0]]
+        pool_power = power[active] - np.sqrt(k[active] / (water * keep[active]))
+        pool_money = k[active] / (power[active] - pool_power) - money[active]
+    else:
+        marginal = keep * money / power
+        order = np.argsort(-marginal, kind='stable')
+        offset = np.cumsum((power / keep)[order]) + demand
+        weight = np.cumsum(np.sqrt(k / keep)[order])
+        level = (weight / offset) ** 2
+        next_marginal = np.append(marginal[order][1:], -np.inf)
+        active = order[:np.flatnonzero(level >= next_marginal)[0] + 1]
+        water = level[len(active) - 1]
+        pool_power = np.sqrt(k[active] * keep[active] / water) - power[active]
+        pool_money = money[active] - k[active] / (power[active] + pool_power)
+
+    fills = []
+    for i, pool, pool_money_i in zip(active.tolist(), pool_power.tolist(), pool_money.tolist()):
+        if pool > 0:
+            fills.append({'amm': amms[i], 'loss': float(1 - keep[i]), 'power': pool, 'money': pool_money_i})
+    return fills
+
+
+def split_order_across_amms(amms, demand, paths_graph, start_node, end_nodes, is_buying, route_cache=None):
+
+    if route_cache is None or route_cache.graph is not paths_graph:
+        route_cache = RouteCache(paths_graph)
+    routes = route_cache.get(start_node, end_nodes[:len(amms)])
+
+    reachable = [(amm, routes[end_node]) for amm, end_node in zip(amms, end_nodes)
+                 if end_node in routes and routes[end_node][0] < 1]
+    if not reachable:
+        return []
+
+    fills = split_order([amm for amm, _ in reachable], [loss for _, (loss, _) in reachable], demand, is_buying)
+    paths = {id(amm): path for amm, (_, path) in reachable}
+    for fill in fills:
+        fill['path'] = paths[id(fill['amm'])]
+    return fills
+
+
+def apply_fills(fills, is_buying):
+
+    for fill in fills:
+        if is_buying:
+            fill['amm'].update_pool_buy(fill['power'], fill['money'])
+        else:
+            fill['amm'].update_pool_sell(fill['power'], fill['money'])
@@ -1,4 +1,15 @@
+import time
+
+import instrumentation
+import numpy as np
+
+from flow import EPSILON, transportation
+from routing import ShortestPathTree, shortest_path_tree, reconstruct_path, k_shortest_paths, path_loss
+
+
 class User:
+    __slots__ = ('user_id', 'role', 'energy', 'price')
+
     def __init__(self, user_id, role, energy, price):
         self.user_id = user_id
         self.role = role  # 'seller' or 'buyer'
@@ -7,9 +18,16 @@ class User:
 
 
 class EnergyMarket:
-    def __init__(self):
+    def __init__(self, exhaustive_paths=False, cache_routes=False):
         self.users = {}
         self.paths = {}
+        self.reverse_paths = {}
+        # Fall back to enumerating every simple path, for cross-checking on small graphs.
+        self.exhaustive_paths = exhaustive_paths
+        # With cache_routes, paths_to keeps one reverse ShortestPathTree per target and add_path /
+        # update_edge_loss repair them instead of searching again.
+        self.cache_routes = cache_routes
+        self.route_trees = {}
 
     def add_user(self, user):
         self.users[user.user_id] = user
@@ -18,11 +36,39 @@ class EnergyMarket:
 
         if from_user_id not in self.paths:
             self.paths[from_user_id] = {}
+        old_loss = self.paths[from_user_id].get(to_user_id, float('inf'))
         self.paths[from_user_id][to_user_id] = loss
 
+        if to_user_id not in self.reverse_paths:
+            self.reverse_paths[to_user_id] = {}
+        self.reverse_paths[to_user_id][from_user_id] = loss
+
+        # Cached trees run on the reversed graph, so the edge is seen as to -> from.
+        for tree in self.route_trees.values():
+            tree.edge_changed(to_user_id, from_user_id, old_loss, loss)
+
+    def add_paths(self, paths):
+
+        # Bulk add_path from a from_user -> {to_user: loss} mapping, e.g. a loaded topology.
+        # Cached route trees are dropped instead of repaired edge by edge.
+        for from_user_id, targets in paths.items():
+            self.paths.setdefault(from_user_id, {}).update(targets)
+            for to_user_id, loss in targets.items():
+                self.reverse_paths.setdefault(to_user_id, {})[from_user_id] = loss
+        self.route_trees.clear()
+
+    def update_edge_loss(self, from_user_id, to_user_id, loss):
+
+        self.add_path(from_user_id, to_user_id, loss)
+
     def find_paths(self, source, target, visited=None):
 
         if visited is None:
+            if instrumentation.enabled:
+                started = time.perf_counter()
+                all_paths = self.find_paths(source, target, set())
+                instrumentation.record("p2p.find_paths", started, paths_enumerated=len(all_paths))
+                return all_paths
             visited = set()
         if source == target:
             return [[source]]
@@ -39,18 +85,67 @@ class EnergyMarket:
         visited.remove(source)
         return all_paths
 
-    def calculate_trade(self):
+    def best_paths(self, source, target, k=1):
+
+        if self.exhaustive_paths:
+            ranked = sorted((path_loss(self.paths, path), path) for path in self.find_paths(source, target))
+            return ranked[:k]
+        return k_shortest_paths(self.paths, source, target, k)
+
+    def _route_tree(self, target, sources):
+
+        # (dist, prev) of one search on the reversed graph, covering at least every source.
+        if self.cache_routes:
+            tree = self.route_trees.get(target)
+            if tree is None:
+                tree = self.route_trees[target] = ShortestPathTree(self.reverse_paths, self.paths, target)
+            return tree.dist, tree.prev
+        return shortest_path_tree(self.reverse_paths, target, targets=sources)
+
+    def paths_to(self, target, sources, tree=None):
+
+        # One search on the reversed graph gives the lowest-loss path from every source to target.
+        dist, prev = tree or self._route_tree(target, sources)
+        best = {}
+        for source in sources:
+            if source in dist:
+                path = reconstruct_path(prev, target, source)
+                path.reverse()
+                best[source] = (dist[source], path)
+        return best
+
+    def calculate_trade(self, clearing='greedy'):
+
+        started = instrumentation.enabled and time.perf_counter()
+        if clearing == 'min_cost_flow':
+            trades = self.clear_min_cost_flow()
+        elif clearing == 'greedy':
+            trades = self._clear_greedy()
+        else:
+            raise ValueError(f"unknown clearing mode: {clearing}")
+        if started:
+            instrumentation.record(f"p2p.calculate_trade.{clearing}", started, trades=len(trades))
+        return trades
+
+    def _clear_greedy(self):
 
         trades = []
         for buyer_id, buyer in self.users.items():
             if buyer.role != 'buyer' or buyer.energy >= 0:
                 continue
 
+            if not self.exhaustive_paths:
+                best_routes = self.paths_to(buyer_id, [seller_id for seller_id, seller in self.users.items()
+                                                       if seller.role == 'seller' and seller.energy > 0])
+
             for seller_id, seller in self.users.items():
                 if seller.role != 'seller' or seller.energy <= 0:
                     continue
 
-                paths = self.find_paths(seller_id, buyer_id)
+                if self.exhaustive_paths:
+                    paths = self.find_paths(seller_id, buyer_id)
+                else:
+                    paths = [best_routes[seller_id][1]] if seller_id in best_routes else []
                 best_path = None
                 best_cost = float('inf')
                 best_loss = 0
@@ -82,6 +177,56 @@ class EnergyMarket:
 
         return trades
 
+    def clear_min_cost_flow(self):
+
+        sellers = [seller_id for seller_id, seller in self.users.items()
+                   if seller.role == 'seller' and seller.energy > 0]
+        buyers = [buyer_id for buyer_id, buyer in self.users.items()
+                  if buyer.role == 'buyer' and buyer.energy < 0]
+
+        # Sellers supply their energy and buyers demand theirs over a dense seller x buyer matrix of
+        # loss-adjusted unit prices. Only losses are read from the route searches; paths are
+        # reconstructed for the pairs that end up trading.
+        seller_index = {seller_id: i for i, seller_id in enumerate(sellers)}
+        prices = np.array([self.users[seller_id].price for seller_id in sellers], dtype=np.float64)
+        losses = np.full((len(sellers), len(buyers)), np.inf)
+        trees = []
+        for j, buyer_id in enumerate(buyers):
+            tree = self._route_tree(buyer_id, sellers)
+            trees.append(tree)
+            dist = tree[0]
+            for seller_id in sellers:
+                if seller_id in dist:
+                    losses[seller_index[seller_id], j] = dist[seller_id]
+
+        flow = transportation([self.users[seller_id].energy for seller_id in sellers],
+                              [-self.users[buyer_id].energy for buyer_id in buyers],
+                              prices[:, None] * (1 + losses))
+
+        trades = []
+        for j, buyer_id in enumerate(buyers):
+            traded = np.flatnonzero(flow[:, j] > EPSILON)
+            if not len(traded):
+                continue
+            routes = self.paths_to(buyer_id, [sellers[i] for i in traded.tolist()], trees[j])
+            for i in traded.tolist():
+                seller_id = sellers[i]
+                total_loss, path = routes[seller_id]
+                trade_amount = float(flow[i, j])
+                trades.append({
+                    "buyer": buyer_id,
+                    "seller": seller_id,
+                    "amount": trade_amount,
+                    "total_cost": prices[i] * (1 + total_loss) * trade_amount,
+                    "total_loss": total_loss,
+                    "path": path
+                })
+
+                self.users[seller_id].energy -= trade_amount
+                self.users[buyer_id].energy += trade_amount
+
+        return trades
+
 if __name__ == "__main__":
     market = EnergyMarket()
 
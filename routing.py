@@ -0,0 +1,469 @@
+import heapq
+import random
+import time
+from itertools import chain, count
+
+import instrumentation
+
+
+def neighbors(graph, node):
+
+    adjacent = graph.get(node, ())
+    if isinstance(adjacent, dict):
+        return adjacent.items()
+    return adjacent
+
+
+def shortest_path_tree(graph, start, targets=None):
+
+    # Predecessor-map Dijkstra; heap entries carry a sequence number so ties never compare nodes.
+    started = instrumentation.enabled and time.perf_counter()
+    settled = {}
+    dist = {start: 0}
+    prev = {start: None}
+    remaining = set(targets) if targets is not None else None
+    tie = count()
+    queue = [(0, next(tie), start)]
+    pop, push = heapq.heappop, heapq.heappush
+    inf = float('inf')
+
+    while queue:
+        total_loss, _, node = pop(queue)
+
+        if node in settled:
+            continue
+        settled[node] = total_loss
+
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+
+        for neighbor, loss in neighbors(graph, node):
+            if neighbor in settled:
+                continue
+            new_loss = total_loss + loss
+            if new_loss < dist.get(neighbor, inf):
+                dist[neighbor] = new_loss
+                prev[neighbor] = node
+                push(queue, (new_loss, next(tie), neighbor))
+
+    if started:
+        pushes = next(tie)
+        instrumentation.record("routing.search", started, nodes_settled=len(settled), edges_relaxed=pushes - 1,
+                               heap_pushes=pushes, heap_pops=pushes - len(queue))
+    return settled, prev
+
+
+def reconstruct_path(prev, start, end):
+
+    if end not in prev:
+        return []
+    path = []
+    node = end
+    while node is not None:
+        path.append(node)
+        node = prev[node]
+    path.reverse()
+    return path if path[0] == start else []
+
+
+def dijkstra(graph, start, end):
+
+    dist, prev = shortest_path_tree(graph, start, targets=(end,))
+    if end not in dist:
+        return float('inf'), []
+    return dist[end], reconstruct_path(prev, start, end)
+
+
+def reverse_graph(graph):
+
+    reversed_graph = {}
+    for node in graph:
+        for neighbor, loss in neighbors(graph, node):
+            incoming = reversed_graph.setdefault(neighbor, {})
+            if loss < incoming.get(node, float('inf')):
+                incoming[node] = loss
+    return reversed_graph
+
+
+def path_loss(graph, path):
+
+    total_loss = 0
+    for i in range(len(path) - 1):
+        total_loss += min(loss for neighbor, loss in neighbors(graph, path[i]) if neighbor == path[i + 1])
+    return total_loss
+
+
+class _MaskedGraph:
+    # Read-only view used by Yen's algorithm to hide nodes and edges of a spur search.
+    def __init__(self, graph, removed_nodes, removed_edges):
+        self.graph = graph
+        self.removed_nodes = removed_nodes
+        self.removed_edges = removed_edges
+
+    def get(self, node, default=()):
+
+        if node in self.removed_nodes:
+            return default
+        return [(neighbor, loss) for neighbor, loss in neighbors(self.graph, node)
+                if neighbor not in self.removed_nodes and (node, neighbor) not in self.removed_edges]
+
+
+def k_shortest_paths(graph, start, end, k):
+
+    best_loss, best_path = dijkstra(graph, start, end)
+    if not best_path:
+        return []
+
+    found = [(best_loss, best_path)]
+    candidates = []
+    seen = {tuple(best_path)}
+    tie = count()
+
+    while len(found) < k:
+        _, last_path = found[-1]
+        for i in range(len(last_path) - 1):
+            spur_node = last_path[i]
+            root_path = last_path[:i + 1]
+
+            removed_edges = set()
+            for _, path in found:
+                if path[:i + 1] == root_path and len(path) > i + 1:
+                    removed_edges.add((path[i], path[i + 1]))
+            removed_nodes = set(root_path[:-1])
+
+            spur_loss, spur_path = dijkstra(
+                _MaskedGraph(graph, removed_nodes, removed_edges), spur_node, end)
+            if not spur_path:
+                continue
+
+            candidate = root_path[:-1] + spur_path
+            if tuple(candidate) in seen:
+                continue
+            seen.add(tuple(candidate))
+            heapq.heappush(candidates, (path_loss(graph, root_path) + spur_loss, next(tie), candidate))
+
+        if not candidates:
+            break
+        total_loss, _, path = heapq.heappop(candidates)
+        found.append((total_loss, path))
+
+    return found
+
+
+def shortest_paths_to_targets(graph, start, targets):
+
+    dist, prev = shortest_path_tree(graph, start, targets=targets)
+    return {target: (dist[target], reconstruct_path(prev, start, target))
+            for target in targets if target in dist}
+
+
+def landmark_bound(from_node, to_node, from_target, to_target):
+
+    # Lower bound on d(node, target) from landmark distances d(L, .) and d(., L) via the triangle
+    # inequality. inf - inf is nan, which never compares greater, so unreachable pairs drop out.
+    bound = 0.0
+    for node_loss, target_loss in zip(from_node, from_target):
+        if target_loss - node_loss > bound:
+            bound = target_loss - node_loss
+    for node_loss, target_loss in zip(to_node, to_target):
+        if node_loss - target_loss > bound:
+            bound = node_loss - target_loss
+    return bound
+
+
+def bidirectional_search(start, end, forward, backward, potential):
+
+    # Bidirectional A* with an averaged potential p: forward keys are d + p(node), backward keys
+    # d - p(node), and the search stops once the two smallest keys reach the best meeting loss.
+    # forward/backward map a node to its (neighbor, loss) pairs; potential returns None for nodes
+    # that cannot lie on any start -> end path. Returns (meet, (dist_f, dist_b), (prev_f, prev_b), settled).
+    inf = float('inf')
+    dist = ({start: 0}, {end: 0})
+    prev = ({start: None}, {end: None})
+    p_start, p_end = potential(start), potential(end)
+    if p_start is None or p_end is None:
+        return None, dist, prev, 0
+
+    tie = count()
+    queues = ([(p_start, next(tie), 0, start)], [(-p_end, next(tie), 0, end)])
+    expand = (forward, backward)
+    pop, push = heapq.heappop, heapq.heappush
+    best, meet = (0, start) if start == end else (inf, None)
+    settled = 0
+
+    while queues[0] and queues[1] and queues[0][0][0] + queues[1][0][0] < best:
+        side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+        _, _, total_loss, node = pop(queues[side])
+        side_dist, other_dist, side_prev = dist[side], dist[1 - side], prev[side]
+        if total_loss > side_dist[node]:
+            continue
+        settled += 1
+
+        queue, sign = queues[side], 1 - 2 * side
+        for neighbor, loss in expand[side](node):
+            new_loss = total_loss + loss
+            if new_loss < side_dist.get(neighbor, inf):
+                p = potential(neighbor)
+                if p is None:
+                    continue
+                side_dist[neighbor] = new_loss
+                side_prev[neighbor] = node
+                push(queue, (new_loss + sign * p, next(tie), new_loss, neighbor))
+                other_loss = other_dist.get(neighbor)
+                if other_loss is not None and new_loss + other_loss < best:
+                    best, meet = new_loss + other_loss, neighbor
+
+    return meet, dist, prev, settled
+
+
+class Landmarks:
+    # ALT preprocessing for one topology: exact losses from and to a few far-apart landmark nodes,
+    # used as lower bounds by alt_dijkstra. Build once per graph and rebuild after mutating it.
+    def __init__(self, graph, count=8, seed=0):
+        self.reverse = reverse_graph(graph)
+        nodes = list(dict.fromkeys(chain(graph, self.reverse)))
+        self.landmarks = []
+        self.from_landmarks = {node: [] for node in nodes}
+        self.to_landmarks = {node: [] for node in nodes}
+        if not nodes:
+            return
+
+        # Farthest-point selection: each landmark maximizes its loss from the ones already chosen;
+        # nodes no landmark reaches come first, so every component gets covered.
+        inf = float('inf')
+        seed_dist, _ = shortest_path_tree(graph, random.Random(seed).choice(nodes))
+        landmark = max(seed_dist, key=seed_dist.get)
+        closest = dict.fromkeys(nodes, inf)
+        for _ in range(min(count, len(nodes))):
+            self.landmarks.append(landmark)
+            from_dist, _ = shortest_path_tree(graph, landmark)
+            to_dist, _ = shortest_path_tree(self.reverse, landmark)
+            for node in nodes:
+                from_loss = from_dist.get(node, inf)
+                self.from_landmarks[node].append(from_loss)
+                self.to_landmarks[node].append(to_dist.get(node, inf))
+                if from_loss < closest[node]:
+                    closest[node] = from_loss
+            landmark = max(closest, key=closest.get)
+            if closest[landmark] == 0:
+                break
+
+    def potential(self, start, end):
+
+        # Averaged ALT potential for one start -> end query, memoized per node.
+        inf = float('inf')
+        from_landmarks, to_landmarks = self.from_landmarks, self.to_landmarks
+        if start not in from_landmarks or end not in from_landmarks:
+            return lambda node: None
+        from_start, to_start = from_landmarks[start], to_landmarks[start]
+        from_end, to_end = from_landmarks[end], to_landmarks[end]
+        cache = {}
+
+        def potential(node):
+            if node in cache:
+                return cache[node]
+            from_node, to_node = from_landmarks[node], to_landmarks[node]
+            to_target = landmark_bound(from_node, to_node, from_end, to_end)
+            from_source = landmark_bound(from_start, to_start, from_node, to_node)
+            value = cache[node] = None if inf in (to_target, from_source) else (to_target - from_source) / 2
+            return value
+        return potential
+
+
+def alt_dijkstra(graph, start, end, landmarks):
+
+    # Same (loss, path) as dijkstra(graph, start, end), settling far fewer nodes on large graphs.
+    # The loss is re-accumulated along the path in forward order so it matches dijkstra bit for bit.
+    if start == end:
+        return 0, [start]
+    started = instrumentation.enabled and time.perf_counter()
+    reverse = landmarks.reverse
+    meet, (dist, _), (prev, next_hop), settled = bidirectional_search(
+        start, end, lambda node: neighbors(graph, node), lambda node: neighbors(reverse, node),
+        landmarks.potential(start, end))
+    if started:
+        instrumentation.record("routing.alt", started, nodes_settled=settled)
+    if meet is None:
+        return float('inf'), []
+
+    path = reconstruct_path(prev, start, meet)
+    total_loss = dist[meet]
+    node = meet
+    while node != end:
+        hop = next_hop[node]
+        total_loss += reverse[hop][node]
+        path.append(hop)
+        node = hop
+    return total_loss, path
+
+
+def set_edge_loss(graph, u, v, loss):
+
+    # Sets every u -> v edge of a dict-of-list or dict-of-dict graph to `loss`, adding the edge if
+    # it is missing, and returns the previous lowest u -> v loss (inf if there was none).
+    adjacent = graph.get(u)
+    if adjacent is None:
+        adjacent = graph[u] = []
+    if isinstance(adjacent, dict):
+        old_loss = adjacent.get(v, float('inf'))
+        adjacent[v] = loss
+        return old_loss
+
+    old_loss = float('inf')
+    for i, (neighbor, edge_loss) in enumerate(adjacent):
+        if neighbor == v:
+            old_loss = min(old_loss, edge_loss)
+            adjacent[i] = (v, loss)
+    if old_loss == float('inf'):
+        adjacent.append((v, loss))
+    return old_loss
+
+
+class ShortestPathTree:
+    # Full single-source tree kept current under edge-loss changes, after Ramalingam-Reps: a decrease
+    # propagates improvements outward from the edge head, and an increase on a tree edge re-solves
+    # only the subtree below it, seeded from its unaffected in-neighbors. `reverse` maps each node
+    # to {predecessor: loss}; the caller updates graph and reverse before calling edge_changed.
+    def __init__(self, graph, reverse, source):
+        self.graph = graph
+        self.reverse = reverse
+        self.source = source
+        self.dist, self.prev = shortest_path_tree(graph, source)
+
+    def path_to(self, target):
+
+        if target not in self.dist:
+            return float('inf'), []
+        return self.dist[target], reconstruct_path(self.prev, self.source, target)
+
+    def _subtree(self, root):
+
+        prev = self.prev
+        subtree = {root}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for neighbor, _ in neighbors(self.graph, node):
+                if neighbor not in subtree and prev.get(neighbor) == node:
+                    subtree.add(neighbor)
+                    stack.append(neighbor)
+        return subtree
+
+    def edge_changed(self, u, v, old_loss, new_loss):
+
+        started = instrumentation.enabled and time.perf_counter()
+        dist, prev = self.dist, self.prev
+        inf = float('inf')
+        tie = count()
+        queue = []
+
+        if new_loss < old_loss:
+            if u in dist and dist[u] + new_loss < dist.get(v, inf):
+                dist[v] = dist[u] + new_loss
+                prev[v] = u
+                queue.append((dist[v], next(tie), v))
+        elif new_loss > old_loss and u in dist and prev.get(v) == u:
+            affected = self._subtree(v)
+            for node in affected:
+                del dist[node]
+            for node in affected:
+                best, parent = inf, None
+                for predecessor, loss in neighbors(self.reverse, node):
+                    if predecessor in dist and dist[predecessor] + loss < best:
+                        best, parent = dist[predecessor] + loss, predecessor
+                if parent is None:
+                    del prev[node]
+                else:
+                    dist[node], prev[node] = best, parent
+                    queue.append((best, next(tie), node))
+            heapq.heapify(queue)
+        else:
+            return
+
+        pop, push = heapq.heappop, heapq.heappush
+        repaired = 0
+        while queue:
+            total_loss, _, node = pop(queue)
+            if total_loss > dist[node]:
+                continue
+            repaired += 1
+            for neighbor, loss in neighbors(self.graph, node):
+                new_total = total_loss + loss
+                if new_total < dist.get(neighbor, inf):
+                    dist[neighbor] = new_total
+                    prev[neighbor] = node
+                    push(queue, (new_total, next(tie), neighbor))
+        if started:
+            instrumentation.record("routing.repair", started, nodes_repaired=repaired)
+
+
+class RouteCache:
+    # Single-source routes keyed by (start, targets). Until the first update_edge_loss each miss is
+    # one search that stops once every target is settled. update_edge_loss switches the cache to
+    # incremental maintenance: it keeps a reversed graph and answers from one full
+    # ShortestPathTree per start, repaired in place on later loss changes. The cache cannot see
+    # edits made to the graph directly (set_edge_loss included): change losses through
+    # update_edge_loss, and call invalidate() after any other change.
+    def __init__(self, graph):
+        self.graph = graph
+        self.routes = {}
+        self.trees = {}
+        self.reverse = None
+
+    def invalidate(self):
+
+        self.routes.clear()
+        self.trees.clear()
+        self.reverse = None
+
+    def tree(self, start):
+
+        tree = self.trees.get(start)
+        if tree is None:
+            if self.reverse is None:
+                self.reverse = reverse_graph(self.graph)
+            tree = self.trees[start] = ShortestPathTree(self.graph, self.reverse, start)
+        return tree
+
+    def get(self, start, targets):
+
+        key = (start, tuple(targets))
+        routes = self.routes.get(key)
+        if routes is None:
+            if self.reverse is None:
+                routes = shortest_paths_to_targets(self.graph, start, targets)
+            else:
+                tree = self.tree(start)
+                routes = {target: tree.path_to(target) for target in targets if target in tree.dist}
+            self.routes[key] = routes
+        return routes
+
+    def update_edge_loss(self, u, v, loss):
+
+        old_loss = set_edge_loss(self.graph, u, v, loss)
+        if self.reverse is None:
+            self.reverse = reverse_graph(self.graph)
+        else:
+            self.reverse.setdefault(v, {})[u] = loss
+        for tree in self.trees.values():
+            tree.edge_changed(u, v, old_loss, loss)
+        self.routes.clear()
+
+
+# Default RouteCache per graph for callers that do not keep their own. Caches for the most
+# recently used graphs are kept; each holds its graph, so a cached id cannot be reused.
+_DEFAULT_ROUTE_CACHES = {}
+DEFAULT_ROUTE_CACHE_GRAPHS = 8
+
+
+def route_cache_for(graph):
+
+    cache = _DEFAULT_ROUTE_CACHES.pop(id(graph), None)
+    if cache is None:
+        cache = RouteCache(graph)
+        if len(_DEFAULT_ROUTE_CACHES) >= DEFAULT_ROUTE_CACHE_GRAPHS:
+            del _DEFAULT_ROUTE_CACHES[next(iter(_DEFAULT_ROUTE_CACHES))]
+    _DEFAULT_ROUTE_CACHES[id(graph)] = cache
+    return cache
@@ -0,0 +1,125 @@
+# Seeded Monte Carlo sweeps of the AMM routing simulation in Dijkstra.py.
+# Run from the repository root: python scenarios.py [runs_per_point] [processes]
+import itertools
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Dijkstra import UniswapV2AMM, execute_trade
+from routing import RouteCache
+
+DEFAULTS = {
+    'pool_count': 3,
+    'pool_money': 1000.0,
+    'pool_power': 1000.0,
+    'topology_size': 20,
+    'fan_out': 3,
+    'loss_low': 0.001,
+    'loss_high': 0.02,
+    'user_count': 100,
+    'demand_low': 1.0,
+    'demand_high': 10.0,
+}
+
+STAT_COLUMNS = ('trades', 'failed', 'power_bought', 'power_sold', 'money_paid', 'mean_loss')
+
+
+def parameter_grid(**axes):
+
+    names = list(axes)
+    return [dict(DEFAULTS, **dict(zip(names, values))) for values in itertools.product(*axes.values())]
+
+
+def build_topology(rng, params):
+
+    nodes = [f"n{i}" for i in range(params['topology_size'])]
+    end_nodes = [f"amm{j}" for j in range(params['pool_count'])]
+    fan_out = min(params['fan_out'], len(nodes))
+
+    def loss():
+        return rng.uniform(params['loss_low'], params['loss_high'])
+
+    paths_graph = {"user": [(node, loss()) for node in rng.sample(nodes, fan_out)]}
+    for node in nodes:
+        paths_graph[node] = [(neighbor, loss()) for neighbor in rng.sample(nodes, fan_out) if neighbor != node]
+    for end_node in end_nodes:
+        for node in rng.sample(nodes, fan_out):
+            paths_graph[node].append((end_node, loss()))
+    return paths_graph, end_nodes
+
+
+def run_scenario(task):
+
+    params, seed = task
+    rng = random.Random(seed)
+    paths_graph, end_nodes = build_topology(rng, params)
+    amms = [UniswapV2AMM(initial_money=params['pool_money'], initial_power=params['pool_power'])
+            for _ in range(params['pool_count'])]
+    route_cache = RouteCache(paths_graph)
+
+    stats = dict.fromkeys(STAT_COLUMNS, 0.0)
+    for _ in range(params['user_count']):
+        is_buying = rng.choice([True, False])
+        demand = rng.uniform(params['demand_low'], params['demand_high'])
+        trade = execute_trade(amms, demand, paths_graph, "user", end_nodes, is_buying, route_cache=route_cache)
+        if trade is None:
+            stats['failed'] += 1
+            continue
+        stats['trades'] += 1
+        stats['mean_loss'] += trade['loss']
+        if is_buying:
+            stats['power_bought'] += demand
+            stats['money_paid'] += trade['cost']
+        else:
+            stats['power_sold'] += demand
+    if stats['trades']:
+        stats['mean_loss'] /= stats['trades']
+
+    return stats, [amm.money for amm in amms], [amm.power for amm in amms]
+
+
+def run_scenarios(grid, runs_per_point, base_seed=0, processes=None):
+
+    # Every (grid point, run) pair gets its own seed, so results do not depend on worker scheduling.
+    tasks = [(params, base_seed + point * runs_per_point + run)
+             for point, params in enumerate(grid) for run in range(runs_per_point)]
+    processes = processes or os.cpu_count()
+    chunksize = max(1, len(tasks) // (processes * 4))
+    if processes == 1:
+        outcomes = list(map(run_scenario, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            outcomes = list(executor.map(run_scenario, tasks, chunksize=chunksize))
+
+    max_pools = max(params['pool_count'] for params, _ in tasks)
+    results = {
+        'seed': np.array([seed for _, seed in tasks], dtype=np.int64),
+        'grid_point': np.repeat(np.arange(len(grid)), runs_per_point),
+        'final_money': np.full((len(tasks), max_pools), np.nan),
+        'final_power': np.full((len(tasks), max_pools), np.nan),
+    }
+    for name in DEFAULTS:
+        results[name] = np.array([params[name] for params, _ in tasks])
+    for name in STAT_COLUMNS:
+        results[name] = np.array([stats[name] for stats, _, _ in outcomes])
+    for row, (_, money, power) in enumerate(outcomes):
+        results['final_money'][row, :len(money)] = money
+        results['final_power'][row, :len(power)] = power
+    return results
+
+
+if __name__ == "__main__":
+    runs_per_point = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    grid = parameter_grid(pool_count=[1, 3, 10], loss_high=[0.02, 0.1], user_count=[100, 1000])
+    results = run_scenarios(grid, runs_per_point, processes=processes)
+
+    for point, params in enumerate(grid):
+        rows = results['grid_point'] == point
+        print(f"pools={params['pool_count']:>3} loss_high={params['loss_high']:.2f} users={params['user_count']:>5} "
+              f"trades={results['trades'][rows].mean():8.1f} failed={results['failed'][rows].mean():6.1f} "
+              f"mean_loss={results['mean_loss'][rows].mean():.4f}")
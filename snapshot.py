@@ -0,0 +1,268 @@
+# Versioned binary snapshots of market state: graph CSR arrays, AMM reserves, resting orders
+# and EnergyMarket users/paths. Layout:
+#
+#     magic (8 bytes) | version (u4) | toc length (u4) | toc (JSON) | arrays, each 64-byte aligned
+#
+# The table of contents records every array's dtype, shape and offset, so load_snapshot can
+# memory-map each one in place. Node and user ids are stored as key tables (utf-8 blob + offsets);
+# tables holding any non-string id are JSON-encoded per key, tuples tagged so they come back as
+# tuples, and ids of any other type are refused when saving.
+import json
+
+import numpy as np
+
+from concentrated_amm import ConcentratedLiquidityAMM
+from script_loader import load_script
+
+MAGIC = b"AMMSNAP\0"
+VERSION = 1
+ALIGNMENT = 64
+PREFIX = np.dtype([('magic', 'S8'), ('version', '<u4'), ('toc_length', '<u4')])
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_arrays(filename, arrays, meta=None, magic=MAGIC, version=VERSION):
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    toc = {'meta': meta or {}, 'arrays': {}}
+    # Offsets depend on the TOC size, so lay out against a generous estimate and re-check.
+    reserve = 4096
+    while True:
+        offset = _aligned(PREFIX.itemsize + reserve)
+        for name, array in arrays.items():
+            # Record arrays keep their field layout; plain dtypes are stored as their type string.
+            dtype = array.dtype.descr if array.dtype.names else array.dtype.str
+            toc['arrays'][name] = {'dtype': dtype, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+        encoded = json.dumps(toc).encode('utf-8')
+        if len(encoded) <= reserve:
+            break
+        reserve = _aligned(len(encoded) * 2)
+
+    with open(filename, 'wb') as output:
+        np.array([(magic, version, len(encoded))], dtype=PREFIX).tofile(output)
+        output.write(encoded)
+        for name, array in arrays.items():
+            output.seek(toc['arrays'][name]['offset'])
+            output.write(array.tobytes())
+
+
+def read_arrays(filename, magic=MAGIC, version=VERSION):
+
+    with open(filename, 'rb') as source:
+        prefix = np.frombuffer(source.read(PREFIX.itemsize), dtype=PREFIX)[0]
+        # 'S8' drops trailing NUL padding, so compare the stripped forms.
+        expected = magic.rstrip(b'\0')
+        if prefix['magic'] != expected:
+            raise ValueError(f"{filename} is not a {expected.decode()} file")
+        if prefix['version'] != version:
+            raise ValueError(f"{filename} has format version {prefix['version']}, expected {version}")
+        toc = json.loads(source.read(int(prefix['toc_length'])))
+
+    arrays = {}
+    for name, entry in toc['arrays'].items():
+        dtype, shape = entry['dtype'], tuple(entry['shape'])
+        dtype = np.dtype([tuple(field) for field in dtype] if isinstance(dtype, list) else dtype)
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=entry['offset'], shape=shape)
+    return arrays, toc['meta']
+
+
+def _json_key(key):
+
+    # JSON has no tuples, so they are written as {"tuple": [...]}.
+    if isinstance(key, tuple):
+        return {'tuple': [_json_key(item) for item in key]}
+    if key is None or isinstance(key, (str, int, float)):
+        return key
+    raise ValueError(f"cannot store id {key!r}: ids must be str, int, float, None or tuples of those")
+
+
+def encode_keys(arrays, meta, name, keys):
+
+    # All-string tables are stored as raw utf-8; anything else is JSON-encoded per key.
+    kind = 'str' if all(isinstance(key, str) for key in keys) else 'json'
+    if kind == 'str':
+        blobs = [key.encode('utf-8') for key in keys]
+    else:
+        blobs = [json.dumps(_json_key(key), ensure_ascii=False).encode('utf-8') for key in keys]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+    arrays[name + '.data'] = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+    arrays[name + '.offsets'] = offsets
+    meta[name + '.kind'] = kind
+
+
+def decode_keys(arrays, meta, name):
+
+    raw = bytes(arrays[name + '.data'])
+    bounds = arrays[name + '.offsets'].tolist()
+    if meta[name + '.kind'] == 'str':
+        decode = lambda blob: blob.decode('utf-8')
+    else:
+        decode = lambda blob: json.loads(blob, object_hook=lambda tagged: tuple(tagged['tuple']))
+    return [decode(raw[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+
+class _KeyTable:
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+
+    def __call__(self, key):
+        key_id = self.ids.get(key)
+        if key_id is None:
+            key_id = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return key_id
+
+
+def save_snapshot(filename, graph=None, amms=None, book=None, market=None):
+
+    arrays = {}
+    meta = {}
+
+    if graph is not None:
+        graph._build()
+        encode_keys(arrays, meta, 'graph.nodes', graph.node_names)
+        arrays['graph.indptr'], arrays['graph.indices'], arrays['graph.loss'] = graph.indptr, graph.indices, graph.loss
+        if graph.landmark_from is not None:
+            arrays['graph.landmark_ids'] = graph.landmark_ids
+            arrays['graph.landmark_from'], arrays['graph.landmark_to'] = graph.landmark_from, graph.landmark_to
+
+    if amms is not None:
+        # UniswapV2AMM keeps money/power; AutomatedMarketMaker keeps reserve_y (money) / reserve_x (power).
+        # A ConcentratedLiquidityAMM's state is its positions, which money/power do not capture.
+        if any(isinstance(amm, ConcentratedLiquidityAMM) for amm in amms):
+            raise ValueError("snapshots cannot hold ConcentratedLiquidityAMM pools")
+        # restore_amms rebuilds every pool with one class, so the list must be of one kind.
+        v2_pools = sum(hasattr(amm, 'money') for amm in amms)
+        if 0 < v2_pools < len(amms):
+            raise ValueError("snapshots hold pools of one kind: got both UniswapV2AMM and AutomatedMarketMaker")
+        meta['amm_kind'] = 'uniswap_v2' if v2_pools else 'constant_product'
+        if meta['amm_kind'] == 'uniswap_v2':
+            reserves = [(amm.money, amm.power) for amm in amms]
+        else:
+            reserves = [(amm.reserve_y, amm.reserve_x) for amm in amms]
+        arrays['amms.money'] = np.array([money for money, _ in reserves], dtype=np.float64)
+        arrays['amms.power'] = np.array([power for _, power in reserves], dtype=np.float64)
+
+    if book is not None:
+        users = _KeyTable()
+        order_types = _KeyTable()
+        orders = list(book.resting_orders())
+        arrays['book.order_id'] = np.array([order.order_id for order in orders], dtype=np.int64)
+        arrays['book.price'] = np.array([order.price for order in orders], dtype=np.float64)
+        arrays['book.quantity'] = np.array([order.quantity for order in orders], dtype=np.float64)
+        arrays['book.is_buy'] = np.array([order.is_buy for order in orders], dtype=np.bool_)
+        arrays['book.user'] = np.array([users(order.user) for order in orders], dtype=np.int32)
+        arrays['book.order_type'] = np.array([order_types(order.order_type) for order in orders], dtype=np.int32)
+        paths = list(book.best_paths.values())
+        arrays['book.path_from'] = np.array([users(path.from_user) for path in paths], dtype=np.int32)
+        arrays['book.path_to'] = np.array([users(path.to_storage) for path in paths], dtype=np.int32)
+        arrays['book.path_loss'] = np.array([path.loss for path in paths], dtype=np.float64)
+        # Path.route node lists, concatenated with CSR bounds; paths without one have an empty span.
+        arrays['book.path_has_route'] = np.array([path.route is not None for path in paths], dtype=np.bool_)
+        arrays['book.route_nodes'] = np.array([users(node) for path in paths for node in path.route or ()],
+                                              dtype=np.int32)
+        arrays['book.route_indptr'] = np.cumsum([0] + [len(path.route or ()) for path in paths], dtype=np.int64)
+        encode_keys(arrays, meta, 'book.users', users.keys)
+        meta['book.order_types'] = order_types.keys
+        meta['book.last_order_id'] = book.last_order_id
+
+    if market is not None:
+        users = _KeyTable()
+        market_users = list(market.users.values())
+        for user in market_users:
+            users(user.user_id)
+        edges = [(source, target, loss) for source, targets in market.paths.items() for target, loss in targets.items()]
+        arrays['market.user_role_seller'] = np.array([user.role == 'seller' for user in market_users], dtype=np.bool_)
+        arrays['market.user_energy'] = np.array([user.energy for user in market_users], dtype=np.float64)
+        arrays['market.user_price'] = np.array([user.price for user in market_users], dtype=np.float64)
+        arrays['market.path_from'] = np.array([users(source) for source, _, _ in edges], dtype=np.int32)
+        arrays['market.path_to'] = np.array([users(target) for _, target, _ in edges], dtype=np.int32)
+        arrays['market.path_loss'] = np.array([loss for _, _, loss in edges], dtype=np.float64)
+        encode_keys(arrays, meta, 'market.users', users.keys)
+
+    write_arrays(filename, arrays, meta)
+
+
+class Snapshot:
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def restore_graph(self, graph_cls=None):
+
+        graph_cls = graph_cls or load_script("one DEX.py").Graph
+        arrays = self.arrays
+        graph = graph_cls.from_csr(decode_keys(arrays, self.meta, 'graph.nodes'),
+                                   arrays['graph.indptr'], arrays['graph.indices'], arrays['graph.loss'])
+        if 'graph.landmark_from' in arrays:
+            graph.landmark_ids = arrays['graph.landmark_ids']
+            graph.landmark_from, graph.landmark_to = arrays['graph.landmark_from'], arrays['graph.landmark_to']
+        return graph
+
+    def restore_amms(self, amm_cls):
+
+        money, power = self.arrays['amms.money'].tolist(), self.arrays['amms.power'].tolist()
+        if self.meta['amm_kind'] == 'uniswap_v2':
+            return [amm_cls(initial_money=m, initial_power=p) for m, p in zip(money, power)]
+        return [amm_cls(reserve_x=p, reserve_y=m) for m, p in zip(money, power)]
+
+    def restore_order_book(self, module=None, store=None):
+
+        module = module or load_script("order book.py")
+        arrays = self.arrays
+        users = decode_keys(arrays, self.meta, 'book.users')
+        order_types = self.meta['book.order_types']
+        book = module.OrderBook(store=store)
+        path_count = len(arrays['book.path_loss'])
+        if 'book.route_indptr' in arrays:
+            nodes = [users[node] for node in arrays['book.route_nodes'].tolist()]
+            bounds = arrays['book.route_indptr'].tolist()
+            routes = [nodes[begin:end] if has_route else None for has_route, begin, end in
+                      zip(arrays['book.path_has_route'].tolist(), bounds, bounds[1:])]
+        else:
+            routes = [None] * path_count
+        for from_user, to_storage, loss, route in zip(arrays['book.path_from'].tolist(), arrays['book.path_to'].tolist(),
+                                                      arrays['book.path_loss'].tolist(), routes):
+            book.add_path(module.Path(users[from_user], users[to_storage], loss, route=route))
+        # Orders were written level by level in FIFO order, so adding them in that order keeps
+        # time priority; with a store the columns are copied in bulk.
+        book.add_orders(arrays['book.order_id'], arrays['book.price'], arrays['book.quantity'], arrays['book.is_buy'],
+                        arrays['book.user'], users, arrays['book.order_type'], order_types)
+        book.last_order_id = self.meta['book.last_order_id']
+        return book
+
+    def restore_market(self, market_cls=None, user_cls=None):
+
+        if market_cls is None or user_cls is None:
+            from p2p import EnergyMarket, User
+            market_cls, user_cls = market_cls or EnergyMarket, user_cls or User
+        arrays = self.arrays
+        users = decode_keys(arrays, self.meta, 'market.users')
+        market = market_cls()
+        for user_id, is_seller, energy, price in zip(users, arrays['market.user_role_seller'].tolist(),
+                                                     arrays['market.user_energy'].tolist(),
+                                                     arrays['market.user_price'].tolist()):
+            market.add_user(user_cls(user_id, 'seller' if is_seller else 'buyer', energy, price))
+        paths = {}
+        for source, target, loss in zip(arrays['market.path_from'].tolist(), arrays['market.path_to'].tolist(),
+                                        arrays['market.path_loss'].tolist()):
+            paths.setdefault(users[source], {})[users[target]] = loss
+        market.add_paths(paths)
+        return market
+
+
+def load_snapshot(filename):
+
+    return Snapshot(*read_arrays(filename))
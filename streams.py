@@ -0,0 +1,60 @@
+# Lazy, seeded input streams and tumbling-window aggregates for long simulations. Draws come from a
+# NumPy Generator in fixed-size blocks, so a stream holds one block in memory however long it runs,
+# and a seed gives the same sequence however much of it is consumed. Streams are infinite; bound
+# them with itertools.islice.
+import numpy as np
+
+
+def demand_stream(user_count, seed=0, low=-10.0, high=10.0, block=4096, prefix="U"):
+
+    # (user_id, power_demand) pairs; a positive demand buys power, a negative one sells it.
+    # seed may also be a numpy Generator, which the stream then draws from.
+    rng = np.random.default_rng(seed)
+    while True:
+        users = rng.integers(user_count, size=block)
+        demands = rng.uniform(low, high, size=block)
+        for user, demand in zip(users.tolist(), demands.tolist()):
+            yield f"{prefix}{user}", demand
+
+
+def order_stream(user_count, seed=0, mid_price=100, spread=10, max_quantity=50, block=4096, prefix="U"):
+
+    # (user, quantity, price, is_buy) tuples for OrderBook on integer price ticks around mid_price,
+    # distributed like benchmarks.generators.order_stream.
+    rng = np.random.default_rng(seed)
+    while True:
+        users = rng.integers(user_count, size=block)
+        is_buy = rng.random(size=block) < 0.5
+        offsets = rng.integers(0, spread, size=block, endpoint=True)
+        prices = np.where(is_buy, mid_price - offsets + spread // 2, mid_price + offsets - spread // 2)
+        quantities = rng.integers(1, max_quantity, size=block, endpoint=True)
+        for user, quantity, price, buy in zip(users.tolist(), quantities.tolist(), prices.tolist(), is_buy.tolist()):
+            yield f"{prefix}{user}", quantity, price, buy
+
+
+def windows(trades, size, carry=()):
+
+    # Consumes trade records with 'quantity', 'money' and 'loss' (the path's loss fraction) and
+    # yields one summary per `size` trades (plus a final partial window): trade count, volume, VWAP
+    # (money per unit), energy lost in transmission (sum of quantity * loss), and the `carry`
+    # fields of the window's last trade, e.g. pool reserves.
+    count = volume = money = loss = 0
+    last = None
+    for trade in trades:
+        count += 1
+        volume += trade['quantity']
+        money += trade['money']
+        loss += trade['quantity'] * trade['loss']
+        last = trade
+        if count == size:
+            yield _summary(count, volume, money, loss, last, carry)
+            count = volume = money = loss = 0
+    if count:
+        yield _summary(count, volume, money, loss, last, carry)
+
+
+def _summary(count, volume, money, loss, last, carry):
+
+    summary = {'trades': count, 'volume': volume, 'vwap': money / volume if volume else float('nan'), 'loss': loss}
+    summary.update((field, last[field]) for field in carry)
+    return summary
@@ -0,0 +1,104 @@
+# Compact on-disk network topologies for large grids. A topology file holds the node-id table, a
+# CSR row index and one (src, dst, loss) record per edge, sorted by src:
+#
+#     magic "AMMTOPO" | version | toc | nodes.data, nodes.offsets | indptr | edges (EDGE_DTYPE)
+#
+# using the snapshot container, so load_topology memory-maps the arrays in place. From there the
+# network is built in bulk as a one DEX.py Graph (zero-copy CSR), a paths_graph dict for the
+# routing functions, or EnergyMarket paths.
+import numpy as np
+
+from routing import neighbors
+from script_loader import load_script
+from snapshot import decode_keys, encode_keys, read_arrays, write_arrays
+
+MAGIC = b"AMMTOPO\0"
+VERSION = 1
+EDGE_DTYPE = np.dtype([('src', '<u4'), ('dst', '<u4'), ('loss', '<f8')])
+
+
+def _write(filename, node_names, src, dst, loss):
+
+    if len(node_names) >= 2 ** 32:
+        raise ValueError(f"{len(node_names)} nodes do not fit the 32-bit node ids of a topology file")
+    src = np.asarray(src, dtype=np.int64)
+    order = np.argsort(src, kind='stable')
+    edges = np.empty(len(src), dtype=EDGE_DTYPE)
+    edges['src'], edges['dst'], edges['loss'] = src[order], np.asarray(dst)[order], np.asarray(loss)[order]
+    indptr = np.zeros(len(node_names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(node_names)), out=indptr[1:])
+
+    arrays = {}
+    meta = {}
+    encode_keys(arrays, meta, 'nodes', node_names)
+    arrays['indptr'], arrays['edges'] = indptr, edges
+    write_arrays(filename, arrays, meta, magic=MAGIC, version=VERSION)
+
+
+def save_topology(filename, edges):
+
+    # edges: (from_node, to_node, loss) tuples, e.g. parsed from a network export, or
+    # ((node, neighbor, loss) for node in paths_graph for neighbor, loss in ...).
+    node_ids = {}
+    src, dst, loss = [], [], []
+    for from_node, to_node, edge_loss in edges:
+        src.append(node_ids.setdefault(from_node, len(node_ids)))
+        dst.append(node_ids.setdefault(to_node, len(node_ids)))
+        loss.append(edge_loss)
+    _write(filename, list(node_ids), src, np.array(dst, dtype=np.int64), np.array(loss, dtype=np.float64))
+
+
+def save_paths_graph(filename, paths_graph):
+
+    save_topology(filename, ((node, neighbor, loss) for node in paths_graph
+                             for neighbor, loss in neighbors(paths_graph, node)))
+
+
+def save_graph(filename, graph):
+
+    graph._build()
+    src = np.repeat(np.arange(len(graph.node_names)), np.diff(graph.indptr))
+    _write(filename, graph.node_names, src, graph.indices, graph.loss)
+
+
+class Topology:
+    def __init__(self, node_names, indptr, edges):
+        self.node_names = node_names
+        self.indptr = indptr
+        self.edges = edges
+
+    def __len__(self):
+
+        return len(self.edges)
+
+    def _rows(self):
+
+        # (node, [(neighbor, loss)]) for every node with outgoing edges.
+        names = self.node_names
+        adjacent = list(zip(map(names.__getitem__, self.edges['dst'].tolist()), self.edges['loss'].tolist()))
+        bounds = self.indptr.tolist()
+        for i in np.flatnonzero(np.diff(self.indptr)).tolist():
+            yield names[i], adjacent[bounds[i]:bounds[i + 1]]
+
+    def to_graph(self, graph_cls=None):
+
+        # The Graph adopts the memory-mapped dst / loss columns; update_edge_loss copies the
+        # losses before its first write.
+        graph_cls = graph_cls or load_script("one DEX.py").Graph
+        return graph_cls.from_csr(self.node_names, self.indptr, self.edges['dst'], self.edges['loss'])
+
+    def to_paths_graph(self):
+
+        # node -> [(neighbor, loss)], the literal form Dijkstra.py and routing.dijkstra take.
+        return dict(self._rows())
+
+    def load_market(self, market):
+
+        market.add_paths({node: dict(adjacent) for node, adjacent in self._rows()})
+        return market
+
+
+def load_topology(filename):
+
+    arrays, meta = read_arrays(filename, magic=MAGIC, version=VERSION)
+    return Topology(decode_keys(arrays, meta, 'nodes'), arrays['indptr'], arrays['edges'])
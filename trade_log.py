@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+
+MAGIC = b"TRADELOG"
+VERSION = 1
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4')])
+
+# One fixed-size record per simulated trade; amm and path are -1 when no route was found.
+TRADE_DTYPE = np.dtype([
+    ('user', '<i8'),
+    ('is_buying', '?'),
+    ('demand', '<f8'),
+    ('amm', '<i4'),
+    ('path', '<i4'),
+    ('cost', '<f8'),
+    ('loss', '<f8'),
+    ('received', '<f8'),
+    ('pool_money', '<f8'),
+    ('pool_power', '<f8'),
+])
+
+
+class TradeLog:
+    # Buffers trade records in a preallocated structured array and appends them to disk in bulk.
+    # Paths are interned; their node lists go to a JSON-lines sidecar file named <filename>.paths.
+    def __init__(self, filename, capacity=4096):
+        self.filename = filename
+        self.buffer = np.zeros(capacity, dtype=TRADE_DTYPE)
+        self.size = 0
+        self.path_ids = {}
+        self.file = open(filename, 'wb')
+        self.paths_file = open(filename + '.paths', 'w', encoding='utf-8')
+        np.array([(MAGIC, VERSION, TRADE_DTYPE.itemsize)], dtype=HEADER).tofile(self.file)
+
+    def _path_id(self, path):
+
+        key = tuple(path)
+        path_id = self.path_ids.get(key)
+        if path_id is None:
+            path_id = self.path_ids[key] = len(self.path_ids)
+            self.paths_file.write(json.dumps(list(key), ensure_ascii=False) + '\n')
+        return path_id
+
+    def record(self, user, is_buying, demand, trade, amms):
+
+        if self.size == len(self.buffer):
+            self.flush()
+        if trade is None:
+            self.buffer[self.size] = (user, is_buying, demand, -1, -1, np.nan, np.nan, 0, np.nan, np.nan)
+        else:
+            amm = amms[trade['amm']]
+            self.buffer[self.size] = (user, is_buying, demand, trade['amm'], self._path_id(trade['path']),
+                                      trade['cost'], trade['loss'], trade['received'], amm.money, amm.power)
+        self.size += 1
+
+    def flush(self):
+
+        self.buffer[:self.size].tofile(self.file)
+        self.size = 0
+        self.file.flush()
+        self.paths_file.flush()
+
+    def close(self):
+
+        self.flush()
+        self.file.close()
+        self.paths_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConsoleSink:
+    # Opt-in human-readable output, matching the simulation scripts' original per-trade printout.
+    def record(self, user, is_buying, demand, trade, amms):
+
+        if trade is None:
+            print(f"第{user}次交易失败，没有可用路径或满足需求的 AMM。")
+            return
+
+        if is_buying:
+            print(f"第{user}次交易：用户买电，买入 {demand:.2f} 电力token，实际获得 {trade['received']:.2f} 电力token，"
+                  f"最佳路径是 {trade['path']}，需要 {trade['cost']:.2f} Money token，损耗了 {trade['loss']:.2%}")
+        else:
+            print(f"第{user}次交易：用户卖电，卖出 {demand:.2f} 电力token，实际获得 {trade['received']:.2f} Money token，"
+                  f"最佳路径是 {trade['path']}，损耗了 {trade['loss']:.2%}")
+
+        print(f"交易后 AMM 状态:")
+        for i, amm in enumerate(amms):
+            print(f"AMM {i} -> 剩余Electricity token: {amm.power:.2f}，剩余Money token: {amm.money:.2f}")
+        print("----")
+
+    def close(self):
+        pass
+
+
+def read_trade_log(filename):
+
+    header = np.fromfile(filename, dtype=HEADER, count=1)[0]
+    if header['magic'] != MAGIC or header['version'] != VERSION:
+        raise ValueError(f"{filename} is not a version {VERSION} trade log")
+    if header['record_size'] != TRADE_DTYPE.itemsize:
+        raise ValueError(f"{filename} has {header['record_size']}-byte records, expected {TRADE_DTYPE.itemsize}")
+
+    if os.path.getsize(filename) == HEADER.itemsize:
+        records = np.zeros(0, dtype=TRADE_DTYPE)
+    else:
+        records = np.memmap(filename, dtype=TRADE_DTYPE, mode='r', offset=HEADER.itemsize)
+    with open(filename + '.paths', encoding='utf-8') as paths_file:
+        paths = [json.loads(line) for line in paths_file]
+    return records, paths
@@ -0,0 +1,182 @@
+# Zone-sharded order matching. Orders and paths are partitioned by the zone of their users (e.g. a
+# feeder or substation); each zone is matched in its own OrderBook on a process pool, then the
+# orders every zone left resting are matched across zones in one reconciliation book that holds
+# the inter-zone paths.
+#
+#     with ZonedMarket(zone_of) as market:
+#         market.add_path(Path("U1", "U2", 0.01))
+#         market.add_order(Order("U1", 10, 101, "limit", True))
+#         transactions = market.match()
+#
+# Run from the repository root for a timing demo: python zones.py [zones] [processes]
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+from script_loader import load_script
+
+order_book = load_script("order book.py")
+
+
+def _book(orders, paths):
+
+    # Orders are (user, quantity, price, order_type, is_buy, order_id) tuples and paths are
+    # (from_user, to_storage, loss); plain tuples pickle far cheaper than Order/Path instances.
+    # Returns the book and its Order objects in input order.
+    book = order_book.OrderBook()
+    for from_user, to_storage, loss in paths:
+        book.add_path(order_book.Path(from_user, to_storage, loss))
+    built = [order_book.Order(*order) for order in orders]
+    for order in built:
+        book.add_order(order)
+    return book, built
+
+
+def _match(orders, paths):
+
+    # match_orders drops both orders of a pair that has no path; here they go back to resting with
+    # whatever they have left, since another zone (or the next round) may still be able to fill them.
+    # match_orders debits the Order objects in place, so their quantities are the residuals.
+    book, built = _book(orders, paths)
+    transactions = book.match_orders()
+    resting = [(order.user, order.quantity, order.price, order.order_type, order.is_buy, order.order_id)
+               for order in built if order.quantity > order_book.MIN_QUANTITY]
+    resting.sort(key=lambda order: order[5])
+    return transactions, resting
+
+
+def match_zone(task):
+
+    # Runs in a worker process: one zone's book from scratch, matched to exhaustion.
+    orders, paths = task
+    return _match(orders, paths)
+
+
+def _crosses(orders):
+
+    bids = [price for _, _, price, _, is_buy, _ in orders if is_buy]
+    asks = [price for _, _, price, _, is_buy, _ in orders if not is_buy]
+    return bool(bids) and bool(asks) and max(bids) >= min(asks)
+
+
+class ZonedMarket:
+    def __init__(self, zone_of, processes=None):
+        # zone_of maps each user (and storage) to its zone. Resting orders are kept per zone as
+        # tuples in arrival order, so every match() can rebuild the zone books in a fresh worker.
+        self.zone_of = zone_of
+        self.orders = {}
+        self.zone_paths = {}
+        self.cross_paths = []
+        self.last_order_id = 0
+        self.processes = processes or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.processes) if self.processes > 1 else None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+    def close(self):
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def add_path(self, path):
+
+        zone = self.zone_of[path.from_user]
+        if self.zone_of[path.to_storage] == zone:
+            self.zone_paths.setdefault(zone, []).append((path.from_user, path.to_storage, path.loss))
+        else:
+            self.cross_paths.append((path.from_user, path.to_storage, path.loss))
+
+    def add_order(self, order):
+
+        # Ids are assigned market-wide, so the reconciliation book can restore time priority
+        # across zones by sorting on them.
+        if order.order_id is None:
+            self.last_order_id += 1
+            order.order_id = self.last_order_id
+        elif order.order_id > self.last_order_id:
+            self.last_order_id = order.order_id
+        self.orders.setdefault(self.zone_of[order.user], []).append(
+            (order.user, order.quantity, order.price, order.order_type, order.is_buy, order.order_id))
+        return order.order_id
+
+    def resting_orders(self):
+
+        for zone, orders in self.orders.items():
+            for user, quantity, price, order_type, is_buy, order_id in orders:
+                yield order_book.Order(user, quantity, price, order_type, is_buy, order_id)
+
+    def match(self):
+
+        # Matches every zone whose book crosses, then reconciles the leftovers across zones.
+        # Transactions are match_orders' dicts with an added 'zone' key, None for cross-zone trades.
+        started = instrumentation.enabled and time.perf_counter()
+        zones = [zone for zone, orders in self.orders.items() if _crosses(orders)]
+        tasks = [(self.orders[zone], self.zone_paths.get(zone, [])) for zone in zones]
+        if self.executor is None:
+            outcomes = list(map(match_zone, tasks))
+        else:
+            chunksize = max(1, len(tasks) // (self.processes * 4))
+            outcomes = list(self.executor.map(match_zone, tasks, chunksize=chunksize))
+
+        transactions = []
+        for zone, (zone_transactions, resting) in zip(zones, outcomes):
+            for transaction in zone_transactions:
+                transaction['zone'] = zone
+            transactions.extend(zone_transactions)
+            self.orders[zone] = resting
+
+        leftovers = [order for orders in self.orders.values() for order in orders]
+        reconciled = 0
+        if self.cross_paths and _crosses(leftovers):
+            # Same-zone pairs were already tried against their zone's paths; only inter-zone ones remain.
+            leftovers.sort(key=lambda order: order[5])
+            cross_transactions, resting = _match(leftovers, self.cross_paths)
+            for transaction in cross_transactions:
+                transaction['zone'] = None
+            transactions.extend(cross_transactions)
+            reconciled = len(leftovers)
+            self.orders = {}
+            for order in resting:
+                self.orders.setdefault(self.zone_of[order[0]], []).append(order)
+
+        if started:
+            instrumentation.record("zones.match", started, zones_matched=len(zones), orders_reconciled=reconciled)
+        return transactions
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    from itertools import islice
+
+    from streams import order_stream
+
+    zone_count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    rng = random.Random(0)
+    users = [f"U{i}" for i in range(zone_count * 20)]
+    zone_of = {user: i % zone_count for i, user in enumerate(users)}
+    with ZonedMarket(zone_of, processes) as market:
+        for buyer in users:
+            for seller in users:
+                same_zone = zone_of[buyer] == zone_of[seller]
+                if same_zone or rng.random() < 0.05:
+                    market.add_path(order_book.Path(buyer, seller, 0.01 if same_zone else rng.uniform(0.03, 0.08)))
+        for user, quantity, price, is_buy in islice(order_stream(len(users), seed=0), zone_count * 5000):
+            market.add_order(order_book.Order(user, quantity, price, "limit", is_buy))
+
+        begin = time.perf_counter()
+        transactions = market.match()
+        elapsed = time.perf_counter() - begin
+        cross = sum(transaction['zone'] is None for transaction in transactions)
+        print(f"zones={zone_count} processes={market.processes} trades={len(transactions)} "
+              f"cross_zone={cross} seconds={elapsed:.2f}")